@@ -1,9 +1,40 @@
 # Author: Michael Fuhrer
 # Created: 2021-03-23   Last Updated: 2021-04-01
 #
-# Used by ner_core to open file/website based on user query.
-import requests
-from bs4 import BeautifulSoup
+# Used by ner_core to open file/website based on user query. requests and asyncio are imported by the methods that
+# scrape websites, so reading files and text never pays for importing them.
+import io
+import os
+import codecs  # Used to decode appended file text that may end mid-character
+import re  # Used by the mapped reader to find crop locations
+import mmap  # Used by the mapped reader to read files without copying them
+import queue  # Used to stream fetched pages to the reader
+import threading  # Used to run fetches alongside NLP parsing
+import urllib.parse  # Used to group fetches by host
+import html.parser  # Used to extract text from websites as they download
+import concurrent.futures  # Used to run blocking fetches for the event loop
+
+fetch_concurrency = 32  # Most pages NER_Web_Fetcher downloads at once
+fetch_per_host = 4  # Most pages NER_Web_Fetcher downloads at once from a single host
+fetch_timeout = 30  # Seconds before a fetch is abandoned
+web_read_size = 65536  # Bytes of a website's response read at a time
+charset_sniff_size = 1024  # Bytes at the start of a page searched for a <meta> charset, as browsers do
+
+# HTML elements whose content is not readable text
+non_content_tags = {"script", "style", "noscript", "template", "head", "svg", "iframe", "object", "canvas"}
+# HTML elements that break lines, and how many newlines they are separated from surrounding text by
+line_break_tags = {
+    "p": 2, "h1": 2, "h2": 2, "h3": 2, "h4": 2, "h5": 2, "h6": 2, "blockquote": 2, "pre": 2, "table": 2, "ul": 2,
+    "ol": 2, "dl": 2, "section": 2, "article": 2, "header": 2, "footer": 2, "hr": 2,
+    "br": 1, "div": 1, "li": 1, "tr": 1, "dt": 1, "dd": 1, "figcaption": 1, "caption": 1, "nav": 1, "aside": 1
+}
+
+# Crop location patterns used by NER_Mapped_Reader. The greedy ".*" runs to the end of the chunk and backtracks, so a
+# match ends just past the last sentence/word end in the chunk, found in a single backward scan.
+sentence_end_pattern = re.compile(rb"(?s).*[.?!]")
+word_end_pattern = re.compile(rb"(?s).*[ \n\t]")
+# Charset declared by a page's <meta charset> or <meta http-equiv="Content-Type"> element
+meta_charset_pattern = re.compile(rb"<meta[^>]*?charset\s*=\s*[\"']?\s*([A-Za-z0-9._:-]+)", re.IGNORECASE)
 
 
 class NER_Article_Reader:
@@ -12,46 +43,563 @@ class NER_Article_Reader:
         if file_name != "":
             self.open_file(file_name)
         self.chunk_size_limit = size_limit  # Bytes/Characters
+        self.chunk_target = 0  # Sentences or tokens to fill each chunk with; 0 fills chunks up to the size limit
+        self.chunk_target_unit = "sentences"  # "sentences" or "tokens"
+        self.crop_separator = ""  # Whitespace dropped when the last chunk was cropped at a word end
         self.carry_over_text = ""
+        self.chunk_offset = 0  # Character offset of the last chunk within the opened text
+        self.read_offset = 0  # Character offset of the next chunk within the opened text
+        self.hold_back = False  # Whether text after the last sentence end is kept back at the end of the opened text
 
     def readNextChunk(self):
         # Returns the next 'chunk' within the opened text file. This chunk will crop out the any incomplete sentence
         # at the end of the chunk, as to preserve the sentence structure to improve NPL parsing behavior down the line.
         read_str = self.carry_over_text  # Copy over any cropped text from previous chunk
         # Read new chunk
-        read_str += self.text_file.read(self.chunk_size_limit - len(self.carry_over_text))
+        read_size = self.chunk_size_limit - len(self.carry_over_text)
+        new_text = self.text_file.read(read_size)
+        read_str += new_text
         # Find crop location.
         sentence_end_loc = max([read_str.rfind("."), read_str.rfind("?"), read_str.rfind("!")])
         word_end_loc = max([read_str.rfind(" "), read_str.rfind("\n"), read_str.rfind("\t")])
+        self.crop_separator = ""
+        if self.hold_back and len(new_text) < read_size:
+            # End of the text so far. The incomplete sentence after the last sentence end may still be being written,
+            # so it is carried over until more text is appended.
+            if sentence_end_loc <= 0:
+                self.carry_over_text = read_str
+                return self.advance("")
+            self.carry_over_text = read_str[sentence_end_loc + 1:]
+            return self.advance(read_str[:sentence_end_loc + 1])
         if sentence_end_loc > 0:
             # Sentence end found, crop incomplete sentence and return
             self.carry_over_text = read_str[sentence_end_loc + 1:]
-            return read_str[:sentence_end_loc + 1]
+            return self.advance(read_str[:sentence_end_loc + 1])
         elif word_end_loc > 0:
             # No sentence end found, but we can separate a word out. Crop and return.
+            self.crop_separator = read_str[word_end_loc]
             self.carry_over_text = read_str[word_end_loc + 1:]
-            return read_str[:word_end_loc]
+            return self.advance(read_str[:word_end_loc])
         else:
             # Unable to crop the chunk meaningfully. Just return the entire chunk.
             self.carry_over_text = ""
-            return read_str
+            return self.advance(read_str)
+
+    def advance(self, chunk):
+        # Records the character offset of the given chunk, which is about to be returned, and moves the offset of the
+        # next chunk past it and any whitespace dropped by cropping it.
+        self.chunk_offset = self.read_offset
+        self.read_offset += len(chunk) + len(self.crop_separator)
+        return chunk
+
+    def chunks(self):
+        # Generator over the remaining chunks of the opened text file. Used to stream a file into the NLP pipeline's
+        # batched nlp.pipe(). Chunks are those returned by readNextChunk, unless a chunk target is set, in which case
+        # consecutive chunks are joined until they hold the target number of sentences or tokens.
+        for [chunk, offset] in self.offsetChunks():
+            yield chunk
+
+    def offsetChunks(self):
+        # Generator over [chunk, offset] pairs of the remaining chunks of the opened text file, where offset is the
+        # character offset of the chunk within the text. See chunks().
+        if self.chunk_target > 0:
+            yield from self.targetChunks()
+            return
+        next_chunk = self.readNextChunk()
+        while next_chunk != "":
+            yield [next_chunk, self.chunk_offset]
+            next_chunk = self.readNextChunk()
+
+    def countUnits(self, text):
+        # Cheaply estimates the number of sentences or tokens within the given text, by counting sentence ends or
+        # whitespace separated words respectively.
+        if self.chunk_target_unit == "sentences":
+            return text.count(".") + text.count("?") + text.count("!")
+        return len(text.split())
+
+    def targetChunks(self):
+        # Generator that joins consecutive chunks, each cropped by the usual rules, until they hold the target number of
+        # sentences or tokens. Chunks keep ending at a sentence end where possible, and whitespace dropped by word-end
+        # crops is put back, so no words are merged.
+        target_chunk = ""
+        target_offset = 0
+        unit_count = 0
+        next_chunk = self.readNextChunk()
+        while next_chunk != "":
+            if target_chunk == "":
+                target_offset = self.chunk_offset
+            target_chunk += next_chunk + self.crop_separator
+            unit_count += self.countUnits(next_chunk)
+            if unit_count >= self.chunk_target:
+                yield [target_chunk, target_offset]
+                target_chunk = ""
+                unit_count = 0
+            next_chunk = self.readNextChunk()
+        if target_chunk != "":
+            yield [target_chunk, target_offset]
 
     def open_file(self, file_name):
-        # Opens the given file.
+        # Opens the given file. Any text carried over from a previously opened file is dropped.
         self.text_file = open(file_name, "r", encoding='utf-8')
+        self.carry_over_text = ""
+        self.read_offset = 0
+
+    def open_text(self, text):
+        # Opens the given text as if it were a file, so it can be chunked like one.
+        self.text_file = io.StringIO(text)
+        self.carry_over_text = ""
+        self.read_offset = 0
+
+    def open_stream(self, text_file):
+        # Opens the given text file object, or any object with a read(size) method returning text, so it can be
+        # chunked. The object is closed by close().
+        self.text_file = text_file
+        self.carry_over_text = ""
+        self.read_offset = 0
+
+    def open_appended(self, file_name, checkpoint=None, hold_back=True):
+        # Opens the text appended to the given file since the given checkpoint, as returned by checkpoint(), or the
+        # whole file if no checkpoint is given. Text carried over and the character offset are restored from the
+        # checkpoint, and unless hold_back is False, text after the last sentence end is held back until more is
+        # appended.
+        if checkpoint is None:
+            checkpoint = {"offset": 0, "carry_over": "", "read_offset": 0}
+        self.text_file = NER_Appended_File(file_name, checkpoint["offset"])
+        self.carry_over_text = checkpoint["carry_over"]
+        self.read_offset = checkpoint["read_offset"]
+        self.hold_back = hold_back
+
+    def checkpoint(self):
+        # Returns the state needed to continue reading the file opened by open_appended() from where reading stopped:
+        # the byte offset read up to, the text held back, and the character offset of the next chunk.
+        return {"offset": self.text_file.offset(), "carry_over": self.carry_over_text, "read_offset": self.read_offset}
 
     def close(self):
         # Closes the open text file.
         self.text_file.close()
+        self.hold_back = False
+
+    def open_url(self, url, save_file_name=""):
+        # Opens the text of the given website as it downloads, so it can be chunked like a file without holding the
+        # whole page in memory. If a save file is given, the text is also saved into it as it is read.
+        import requests
+        response = requests.get(url, stream=True, timeout=fetch_timeout)
+        response.raise_for_status()
+        self.text_file = NER_Web_Text(response, save_file_name=save_file_name)
+        self.carry_over_text = ""
+        self.read_offset = 0
 
     def webscape(self, url, save_file_name):
-        # Uses requests and Beautiful Soup to scape text of the html file of a given website and save it into the
-        # designated file. Reader will then reopen the file to be read for NER parsing.
-        page = requests.get(url)
-        soup = BeautifulSoup(page.content, 'html.parser')
+        # Scrapes the text of a given website and saves it into the designated file, as it downloads. Reader will then
+        # reopen the file to be read for NER parsing.
+        self.open_url(url, save_file_name)
         # Saving webpage text to file
-        save_file = open(save_file_name, "w", encoding='utf-8')
-        save_file.write(soup.text)
-        save_file.close()
+        while self.text_file.read(web_read_size) != "":
+            pass
+        self.close()
         # Reopen file in read-only to NER parsing
-        self.open_file(save_file_name)
\ No newline at end of file
+        self.open_file(save_file_name)
+
+    def fetchText(self, url):
+        # Scrapes the text of a given website and returns it.
+        self.open_url(url)
+        text = self.text_file.read_all()
+        self.close()
+        return text
+
+
+class NER_HTML_Text(html.parser.HTMLParser):
+    # Incremental HTML-to-text extractor. HTML can be fed in pieces of any size, and the text extracted so far taken
+    # after each, so a page never needs to be held in memory as a whole or as a tree. Script, style and other
+    # non-content elements are dropped. Whitespace is collapsed as a browser would, except within <pre>, and block
+    # elements are separated by a line break or a blank line, so no runs of blank lines are left over from the page's
+    # source formatting. Pages are parsed by lxml's faster libxml2 parser when lxml is installed, and by Python's
+    # html.parser otherwise; both pass their tags and text to the same handlers.
+
+    def __init__(self, use_lxml=True):
+        super().__init__(convert_charrefs=True)
+        self.lxml_parser = None
+        self.lxml_fed = False  # Whether lxml was given any HTML, as libxml2 rejects closing an empty document
+        if use_lxml:
+            try:
+                import lxml.etree  # Imported here, as it is optional and only needed to scrape websites
+                self.lxml_parser = lxml.etree.HTMLParser(target=NER_LXML_Target(self))
+            except ImportError:
+                pass
+        self.pieces = []  # Text extracted but not yet taken
+        self.skip_depth = 0  # Number of open non-content elements
+        self.pre_depth = 0  # Number of open <pre> elements
+        self.pending_breaks = 0  # Newlines owed before the next text
+        self.pending_space = False  # Whether a space is owed before the next text
+        self.started = False  # Whether any text was extracted yet
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            # The end of <head> may be left out
+            self.skip_depth = 0
+        elif tag in non_content_tags:
+            self.skip_depth += 1
+        if tag == "pre":
+            self.pre_depth += 1
+        self.line_break(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.line_break(tag)
+
+    def feed(self, data):
+        if self.lxml_parser is None:
+            super().feed(data)
+        elif data != "":
+            self.lxml_parser.feed(data)
+            self.lxml_fed = True
+
+    def close(self):
+        if self.lxml_parser is None:
+            super().close()
+        elif self.lxml_fed:
+            self.lxml_parser.close()
+
+    def handle_endtag(self, tag):
+        if tag in non_content_tags:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        if tag == "pre":
+            self.pre_depth = max(0, self.pre_depth - 1)
+        self.line_break(tag)
+
+    def line_break(self, tag):
+        # Owes the newlines the given element is separated from surrounding text by, if it breaks lines.
+        if tag in line_break_tags and self.skip_depth == 0:
+            self.pending_breaks = max(self.pending_breaks, line_break_tags[tag])
+            self.pending_space = False
+
+    def handle_data(self, data):
+        if self.skip_depth > 0:
+            return
+        if self.pre_depth > 0:
+            text = data
+        else:
+            text = " ".join(data.split())
+            if text == "":
+                self.pending_space = self.pending_space or data != ""
+                return
+            if data[0].isspace():
+                self.pending_space = True
+        if self.started and self.pending_breaks > 0:
+            self.pieces.append("\n" * self.pending_breaks)
+        elif self.started and self.pending_space:
+            self.pieces.append(" ")
+        self.pieces.append(text)
+        self.started = True
+        self.pending_breaks = 0
+        self.pending_space = self.pre_depth == 0 and data[-1].isspace()
+
+    def take(self):
+        # Returns the text extracted since the last call.
+        text = "".join(self.pieces)
+        self.pieces = []
+        return text
+
+
+class NER_LXML_Target:
+    # lxml parser target passing the tags and text lxml parses to an NER_HTML_Text's handlers.
+
+    def __init__(self, text):
+        self.text = text
+
+    def start(self, tag, attrib):
+        self.text.handle_starttag(tag, attrib)
+
+    def end(self, tag):
+        self.text.handle_endtag(tag)
+
+    def data(self, data):
+        self.text.handle_data(data)
+
+    def close(self):
+        pass
+
+
+class NER_Web_Text:
+    # Read-only text view of a website's requests response as it downloads. The body is read a block at a time,
+    # decoded incrementally, and, for HTML pages, passed through NER_HTML_Text, so only the text not yet read is held
+    # in memory. Other pages, like plain text files, are passed through with their newlines translated. If a save file
+    # is given, the text is written to it as it is read. Text is decoded with the charset the server gives, or else the
+    # one an HTML page declares in a <meta> element near its start, or else UTF-8.
+
+    def __init__(self, response, read_size=web_read_size, save_file_name=""):
+        self.response = response
+        self.save_file = open(save_file_name, "w", encoding='utf-8') if save_file_name != "" else None
+        self.blocks = response.iter_content(read_size)
+        content_type = response.headers.get("Content-Type", "").lower()
+        self.parser = NER_HTML_Text() if "html" in content_type else None
+        self.encoding = None
+        if "charset=" in content_type:
+            self.encoding = content_type.split("charset=")[1].split(";")[0].strip().strip('"') or None
+        self.decoder = None  # Created once the charset is known
+        self.head = b""  # Start of the page held until it can be searched for a <meta> charset
+        self.buffer = ""
+        self.finished = False
+
+    def decode(self, data):
+        # Decodes the given block of the response, or the end of it if None. Until the charset is known, blocks are
+        # held until enough of the page has arrived to search it for a <meta> charset.
+        final = data is None
+        if self.decoder is None:
+            self.head += data if data is not None else b""
+            sniffing = self.encoding is None and self.parser is not None
+            if sniffing and not final and len(self.head) < charset_sniff_size:
+                return ""
+            encoding = self.encoding
+            if sniffing:
+                declared = meta_charset_pattern.search(self.head[:charset_sniff_size])
+                encoding = declared.group(1).decode("ascii") if declared is not None else None
+            try:
+                decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            self.decoder = io.IncrementalNewlineDecoder(decoder, translate=True)
+            [data, self.head] = [self.head, b""]
+        return self.decoder.decode(data if data is not None else b"", final=final)
+
+    def read(self, size):
+        # Returns up to the given number of characters, fewer only once the whole response has been read.
+        while len(self.buffer) < size and not self.finished:
+            data = next(self.blocks, None)
+            text = self.decode(data)
+            if self.parser is not None:
+                self.parser.feed(text)
+                if data is None:
+                    self.parser.close()
+                text = self.parser.take()
+            self.buffer += text
+            self.finished = data is None
+        text = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        if self.save_file is not None:
+            self.save_file.write(text)
+        return text
+
+    def read_all(self):
+        # Returns all the remaining text.
+        pieces = []
+        text = self.read(web_read_size)
+        while text != "":
+            pieces.append(text)
+            text = self.read(web_read_size)
+        return "".join(pieces)
+
+    def close(self):
+        self.response.close()
+        if self.save_file is not None:
+            self.save_file.close()
+
+
+class NER_Appended_File:
+    # Read-only text view of a file from a byte offset to its current end, for reading text appended to a growing file.
+    # Bytes are decoded incrementally, with newlines translated like a file opened in text mode, so a multi-byte
+    # character or "\r\n" split by a writer that has only flushed half of it is held back rather than garbled.
+
+    def __init__(self, file_name, offset=0, block_size=65536):
+        self.file = open(file_name, "rb")
+        self.file.seek(offset)
+        self.block_size = block_size
+        self.decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+        self.buffer = ""
+
+    def read(self, size):
+        # Returns up to the given number of characters, fewer only once the end of the file is reached.
+        while len(self.buffer) < size:
+            data = self.file.read(self.block_size)
+            if data == b"":
+                break
+            self.buffer += self.decoder.decode(data)
+        text = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return text
+
+    def offset(self):
+        # Returns the byte offset of the first byte not yet returned as text. Only exact once read() has reached the
+        # end of the file, as text decoded ahead of a read is not counted back.
+        [pending_bytes, flags] = self.decoder.getstate()
+        return self.file.tell() - len(pending_bytes) - (flags & 1) - len(self.buffer.encode('utf-8'))
+
+    def close(self):
+        self.file.close()
+
+
+class NER_Mapped_Reader(NER_Article_Reader):
+    # Article reader that memory-maps the opened file instead of reading it into strings. Rather than keeping carried
+    # over text, the reader keeps the byte offset of the next chunk and finds each crop location in place, with one
+    # backward scan of the mapped file. Chunks follow the same cropping rules as NER_Article_Reader, but the size limit
+    # counts bytes rather than characters, so chunks of non-ASCII text can hold fewer characters.
+
+    def __init__(self, file_name="", size_limit=8184):
+        self.mapped_file = None
+        self.position = 0
+        self.size = 0
+        self.translate_newlines = False
+        super().__init__(file_name, size_limit)
+
+    def open_file(self, file_name):
+        # Memory-maps the given file. Empty files can not be mapped, so they are read as empty text.
+        with open(file_name, "rb") as text_file:
+            size = os.fstat(text_file.fileno()).st_size
+            if size == 0:
+                self.open_buffer(b"")
+            else:
+                self.open_buffer(mmap.mmap(text_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def open_text(self, text):
+        # Opens the given text as if it were a file, so it can be chunked like one.
+        self.open_buffer(text.encode("utf-8"))
+
+    def open_buffer(self, buffer):
+        # Starts reading the given bytes-like buffer from its beginning. Like text-mode files, "\r\n" and "\r" line
+        # endings are read as "\n", which only costs a replace when the buffer contains any carriage returns.
+        self.close()
+        self.mapped_file = buffer
+        self.position = 0
+        self.read_offset = 0
+        self.size = len(buffer)
+        self.translate_newlines = buffer.find(b"\r") != -1
+
+    def nextSpan(self):
+        # Returns the [start, end) byte offsets of the next chunk within the opened file, without copying it. Both
+        # offsets are equal once the whole file has been read.
+        start = self.position
+        window_end = min(start + self.chunk_size_limit, self.size)
+        self.crop_separator = ""
+        if start >= window_end:
+            return [start, start]
+        # Find crop location.
+        match = sentence_end_pattern.match(self.mapped_file, start, window_end)
+        if match is not None and match.end() - 1 > start:
+            # Sentence end found, crop incomplete sentence
+            self.position = match.end()
+            return [start, match.end()]
+        match = word_end_pattern.match(self.mapped_file, start, window_end)
+        end = start if match is None else match.end() - 1
+        if self.translate_newlines and end > start and self.mapped_file[end] == 0x0A and \
+                self.mapped_file[end - 1] == 0x0D:
+            # Cropping at a "\r\n" line ending, which is read as a single newline, so drop both
+            end -= 1
+        if end > start:
+            # No sentence end found, but we can separate a word out. Crop, dropping the separating whitespace.
+            self.crop_separator = chr(self.mapped_file[match.end() - 1])
+            self.position = match.end()
+            return [start, end]
+        # Unable to crop the chunk meaningfully. Use the entire chunk, moving its end back so it doesn't split a
+        # multi-byte UTF-8 character or a "\r\n" line ending.
+        end = window_end
+        while start < end < self.size and (self.mapped_file[end] & 0xC0) == 0x80:
+            end -= 1
+        if start + 1 < end < self.size and self.mapped_file[end - 1] == 0x0D and self.mapped_file[end] == 0x0A:
+            end -= 1
+        if end == start:
+            end = window_end
+        self.position = end
+        return [start, end]
+
+    def spans(self):
+        # Generator over the [start, end) byte offsets of the remaining chunks of the opened file.
+        [start, end] = self.nextSpan()
+        while start != end:
+            yield [start, end]
+            [start, end] = self.nextSpan()
+
+    def view(self, start, end):
+        # Returns a zero-copy view of the given byte range of the opened file.
+        return memoryview(self.mapped_file)[start:end]
+
+    def readNextChunk(self):
+        # Returns the next 'chunk' within the opened file as text. See nextSpan() for cropping behavior. Chunk offsets
+        # count characters of the decoded text, like NER_Article_Reader, rather than bytes.
+        [start, end] = self.nextSpan()
+        if start == end:
+            return self.advance("")
+        with self.view(start, end) as chunk_view:
+            chunk = str(chunk_view, "utf-8")
+        if self.translate_newlines:
+            chunk = chunk.replace("\r\n", "\n").replace("\r", "\n")
+        return self.advance(chunk)
+
+    def close(self):
+        # Unmaps the opened file.
+        if isinstance(self.mapped_file, mmap.mmap):
+            self.mapped_file.close()
+        self.mapped_file = None
+        self.size = 0
+        self.position = 0
+
+
+class NER_Web_Fetcher:
+    # Fetches many websites concurrently and extracts their text. An asyncio event loop schedules the fetches, limiting
+    # how many run at once overall and per host, while the blocking requests themselves run on a thread pool sharing a
+    # pooled requests session, so connections to a host are reused.
+
+    def __init__(self, concurrency=fetch_concurrency, per_host=fetch_per_host, timeout=fetch_timeout):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        import requests.adapters
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetchPage(self, url):
+        # Downloads a single website and returns its text. Runs on the fetcher's thread pool.
+        page = self.session.get(url, timeout=self.timeout, stream=True)
+        try:
+            page.raise_for_status()
+            return NER_Web_Text(page).read_all()
+        finally:
+            page.close()
+
+    async def fetchAll(self, urls, results):
+        # Fetches every given URL and puts a [url, text, error] entry into the results queue as each one finishes;
+        # text is None if the fetch failed. A fetch keeps its slot until its entry is queued, so a full results queue
+        # holds back further fetches.
+        import asyncio
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        host_slots = {}
+
+        async def fetch(url):
+            host = urllib.parse.urlsplit(url).netloc
+            if host not in host_slots:
+                host_slots[host] = asyncio.Semaphore(self.per_host)
+            # The host slot is taken first, so fetches waiting on a busy host don't hold up other hosts.
+            async with host_slots[host]:
+                async with slots:
+                    try:
+                        entry = [url, await loop.run_in_executor(executor, self.fetchPage, url), None]
+                    except Exception as error:
+                        entry = [url, None, str(error)]
+                    await loop.run_in_executor(executor, results.put, entry)
+
+        with concurrent.futures.ThreadPoolExecutor(self.concurrency + 1) as executor:
+            await asyncio.gather(*[fetch(url) for url in urls])
+
+    def texts(self, urls):
+        # Generator over [url, text, error] entries for the given URLs, in the order they finish. Fetching runs in a
+        # background thread, so callers can parse one page while the next ones download.
+        results = queue.Queue(maxsize=self.concurrency)
+        done = object()
+
+        def fetch_thread():
+            import asyncio
+            try:
+                asyncio.run(self.fetchAll(urls, results))
+            finally:
+                results.put(done)
+
+        threading.Thread(target=fetch_thread, daemon=True).start()
+        entry = results.get()
+        while entry is not done:
+            yield entry
+            entry = results.get()
+
+    def close(self):
+        # Closes the pooled session's connections.
+        self.session.close()
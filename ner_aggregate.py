@@ -0,0 +1,159 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Alternatives to the SortedSet NER_Core collects desired tokens into, which also count how often each token occurs.
+# NER_Spill_Set counts tokens in a hash map, which is cheaper to insert into than a sorted set, and once the map's
+# estimated memory use passes a threshold it is spilled to disk as a sorted run. Iterating merges the runs back into
+# one alphabetical list of unique tokens. NER_Top_K keeps only the most frequent tokens in a fixed amount of memory.
+import os  # Used to delete spilled runs
+import sys  # Used to estimate memory use and intern tokens
+import json  # Used to write and read spilled runs
+import heapq  # Used to merge spilled runs
+import weakref  # Used to delete spilled runs once the set is discarded
+import tempfile  # Used to create spilled runs
+
+spill_entry_overhead = 100  # Estimated bytes of hash map overhead per unique token
+top_k_factor = 100  # Counters NER_Top_K keeps per requested token, the more kept the more accurate its counts
+
+
+def _delete_runs(run_files):
+    # Deletes the given spilled run files.
+    for run_file in run_files:
+        if os.path.exists(run_file):
+            os.remove(run_file)
+
+
+class NER_Spill_Set:
+    # Counts tokens in a dictionary, spilling it to disk as a sorted run whenever its estimated size passes the memory
+    # limit. Supports the parts of the SortedSet interface NER_Core uses: add(), update(), clear(), len() and
+    # iteration in alphabetical order.
+
+    def __init__(self, memory_limit=None, intern_tokens=True):
+        # A memory limit of None never spills, making the set a plain token counter.
+        self.memory_limit = memory_limit
+        self.intern_tokens = intern_tokens
+        self.counts = {}
+        self.memory = 0
+        self.run_files = []
+        self.finalizer = weakref.finalize(self, _delete_runs, self.run_files)
+
+    def add(self, token, count=1):
+        # Counts an occurrence of the given token. Interning the token means repeated tokens share one string.
+        if self.intern_tokens:
+            token = sys.intern(token)
+        if token in self.counts:
+            self.counts[token] += count
+            return
+        self.counts[token] = count
+        self.memory += sys.getsizeof(token) + spill_entry_overhead
+        if self.memory_limit is not None and self.memory > self.memory_limit:
+            self.spill()
+
+    def update(self, tokens):
+        # Counts an occurrence of each of the given tokens.
+        for token in tokens:
+            self.add(token)
+
+    def spill(self):
+        # Writes the counted tokens to disk as a run sorted by token, one JSON [token, count] pair per line, and
+        # empties the dictionary.
+        [run_handle, run_file] = tempfile.mkstemp(prefix="grier-ner-run-", suffix=".jsonl")
+        with os.fdopen(run_handle, "w", encoding='utf-8') as run:
+            for token in sorted(self.counts):
+                run.write(json.dumps([token, self.counts[token]], ensure_ascii=False) + "\n")
+        self.run_files.append(run_file)
+        self.counts = {}
+        self.memory = 0
+
+    def read_run(self, run_file):
+        # Generator over the [token, count] pairs of a spilled run.
+        with open(run_file, "r", encoding='utf-8') as run:
+            for line in run:
+                yield json.loads(line)
+
+    def items(self):
+        # Generator over [token, count] pairs of every unique token in alphabetical order, merging the spilled runs
+        # with the tokens still in memory and adding up the counts of tokens that appear in several of them.
+        runs = [self.read_run(run_file) for run_file in self.run_files]
+        runs.append([token, self.counts[token]] for token in sorted(self.counts))
+        current = None
+        for [token, count] in heapq.merge(*runs, key=lambda pair: pair[0]):
+            if current is not None and current[0] == token:
+                current[1] += count
+                continue
+            if current is not None:
+                yield current
+            current = [token, count]
+        if current is not None:
+            yield current
+
+    def __iter__(self):
+        for [token, count] in self.items():
+            yield token
+
+    def __len__(self):
+        if len(self.run_files) == 0:
+            return len(self.counts)
+        return sum(1 for _ in self.items())
+
+    def clear(self):
+        # Forgets every counted token and deletes any spilled runs.
+        _delete_runs(self.run_files)
+        self.run_files.clear()
+        self.counts = {}
+        self.memory = 0
+
+
+class NER_Top_K:
+    # Streaming top-K token counter using the space-saving algorithm. A fixed number of counters is kept; when a new
+    # token arrives and every counter is taken, the token with the lowest count is evicted and the new token inherits
+    # its count. Counts may therefore be overestimated by at most the evicted count, but any token that occurs more
+    # often than the lowest kept count is guaranteed to be kept. If no more unique tokens occur than there are counters,
+    # every count is exact. Iterates tokens from most to least frequent.
+
+    def __init__(self, k, capacity=None):
+        self.k = k
+        self.capacity = max(k, capacity if capacity is not None else k * top_k_factor)
+        self.counts = {}
+        self.heap = []  # [count, token] entries, including stale ones for counts that have since grown
+
+    def add(self, token, count=1):
+        # Counts the given number of occurrences of a token.
+        if token in self.counts:
+            self.counts[token] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[token] = count
+        else:
+            # Evict the lowest count, skipping stale heap entries
+            [lowest_count, lowest_token] = heapq.heappop(self.heap)
+            while self.counts.get(lowest_token) != lowest_count:
+                [lowest_count, lowest_token] = heapq.heappop(self.heap)
+            del self.counts[lowest_token]
+            self.counts[token] = lowest_count + count
+        heapq.heappush(self.heap, [self.counts[token], token])
+        if len(self.heap) > 4 * self.capacity:
+            # Drop stale entries
+            self.heap = [[token_count, counted_token] for [counted_token, token_count] in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def update(self, tokens):
+        # Counts an occurrence of each of the given tokens.
+        for token in tokens:
+            self.add(token)
+
+    def items(self):
+        # Returns [token, count] pairs of the K most frequent tokens, most frequent first, ties in alphabetical order.
+        ranked = sorted(self.counts.items(), key=lambda pair: (-pair[1], pair[0]))
+        return [[token, count] for [token, count] in ranked[:self.k]]
+
+    def __iter__(self):
+        for [token, count] in self.items():
+            yield token
+
+    def __len__(self):
+        return min(self.k, len(self.counts))
+
+    def clear(self):
+        # Forgets every counted token.
+        self.counts = {}
+        self.heap = []
@@ -0,0 +1,385 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Benchmark harness for Grier-NER. Separately times starting ner_fuhrer.py, loading each spaCy pipeline, chunking each
+# sample file at each chunk size, and passing the chunks through the pipeline one call per chunk and batched through
+# nlp.pipe(). Each pipeline is also timed on The Great Gatsby at each thread count, in as many processes, pinned to
+# their own cores, as the host has room for, to find the mix of pipelines and threads with the best throughput. Every
+# measurement is repeated after an untimed warm-up run and summarized, results are written as JSON, and a previous
+# results file can be given as a baseline to flag regressions.
+#
+# Usage: python ner_benchmark.py [-f <file> ...] [-s <size> ...] [-m <model> ...] [-t <threads> ...] [-r <repeats>]
+#                                [-b <batch size>] [-tb <transformer batch size>] [-o <results file>]
+#                                [-baseline <results file>] [-tolerance <percent>]
+import sys  # Used to retrieve arguments and exit with a failing status on regressions
+import os  # Used to name results by file
+import gc  # Used to collect garbage between timed runs
+import json  # Used to write results and read baselines
+import time  # Used to time runs
+import platform  # Used to record the benchmarking environment
+import statistics  # Used to summarize repeated runs
+import subprocess  # Used to time starting ner_fuhrer.py
+import multiprocessing  # Used to start thread benchmark processes that load their pipelines afresh
+import concurrent.futures  # Used to run thread benchmark processes side by side
+import ner_core
+from ner_core import NER_Core
+from article_handler import NER_Article_Reader
+
+benchmark_files = ["tests/emancipation-proclamation.txt", "tests/great-gatsby.txt", "tests/moby-dick.txt"]
+benchmark_sizes = ["1024", "4092", "8184", "25s"]
+benchmark_models = ["en_core_web_sm", "en_core_web_trf"]
+benchmark_repeats = 5  # Timed runs of each measurement, after one untimed warm-up run
+benchmark_batch_size = 64  # nlp.pipe() batch size of batched runs
+benchmark_transformer_batch_size = 8  # nlp.pipe() batch size of transformer pipelines in thread benchmarks
+thread_benchmark_file = "tests/great-gatsby.txt"
+thread_benchmark_size = "8184"
+# Arguments ner_fuhrer.py is started with to time start-up. Neither loads a pipeline or reads any text.
+startup_arguments = {"help": [], "parse-error": ["-p", "not-a-pos"]}
+regression_tolerance = 10  # Percent a median may worsen by against the baseline before it is flagged
+
+# Higher is better for rates, lower is better for everything else
+rate_metrics = ["chunks_per_second", "tokens_per_second", "host_tokens_per_second", "characters_per_second"]
+
+
+def default_thread_counts():
+    # Returns the thread counts benchmarked by default: powers of two up to the host's available cores, and the cores.
+    cores = len(ner_core.available_cores())
+    counts = [threads for threads in [1, 2, 4, 8, 16, 32, 64] if threads < cores]
+    return counts + [cores]
+
+
+def summarize(samples):
+    # Returns summary statistics of a list of repeated measurements.
+    return {
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "min": min(samples),
+        "max": max(samples),
+        "runs": len(samples)
+    }
+
+
+def time_runs(run, repeats, warm_up=True):
+    # Calls the given function the given number of times and returns the seconds each call took. Garbage is collected
+    # before every call so one run's garbage is not collected during the next, and an untimed warm-up call is made
+    # first unless disabled.
+    if warm_up:
+        run()
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        t_start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - t_start)
+    return timings
+
+
+def chunk_file(file_name, size):
+    # Returns the chunks the article reader crops the given file into at the given "-s" format chunk size.
+    core = NER_Core()
+    core.reader = NER_Article_Reader(file_name)
+    core.set_chunk_size(size)
+    chunks = list(core.reader.chunks())
+    core.reader.close()
+    return chunks
+
+
+def benchmark_startup(name, arguments, repeats):
+    # Times starting ner_fuhrer.py with the given arguments in a new Python process until it exits. Returns a result
+    # entry.
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ner_fuhrer.py")] + arguments
+    timings = time_runs(lambda: subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), repeats)
+    return {"name": "startup/" + name, "stage": "startup", "arguments": arguments, "seconds": summarize(timings)}
+
+
+def benchmark_model_load(model_name, repeats):
+    # Times loading the given pipeline from disk, clearing the model cache before every load. Returns a result entry,
+    # or None if the pipeline is not installed.
+    def load():
+        ner_core.clear_model_cache()
+        ner_core.load_pipeline(model_name)
+    try:
+        timings = time_runs(load, repeats, warm_up=False)
+    except OSError:
+        return None
+    return {"name": "load/" + model_name, "stage": "load", "model": model_name, "seconds": summarize(timings)}
+
+
+def benchmark_chunking(file_name, size, repeats):
+    # Times cropping the given file into chunks of the given size. Returns a result entry.
+    chunks = chunk_file(file_name, size)
+    characters = sum(len(chunk) for chunk in chunks)
+    timings = time_runs(lambda: chunk_file(file_name, size), repeats)
+    return {
+        "name": "chunking/" + os.path.basename(file_name) + "/" + size,
+        "stage": "chunking", "file": os.path.basename(file_name), "size": size,
+        "chunks": len(chunks), "characters": characters,
+        "seconds": summarize(timings),
+        "chunks_per_second": summarize([len(chunks) / seconds for seconds in timings]),
+        "characters_per_second": summarize([characters / seconds for seconds in timings])
+    }
+
+
+def benchmark_nlp(core, file_name, size, chunks, batched, repeats):
+    # Times passing already cropped chunks through the core's pipeline, either one call per chunk or batched through
+    # nlp.pipe(). Only the NLP model is timed, not reading or collecting tokens. Returns a result entry.
+    token_count = [0]
+
+    def read():
+        if batched:
+            token_count[0] = sum(len(doc) for doc in core.pipe_texts(chunks))
+        else:
+            token_count[0] = sum(len(core.nlp(chunk, disable=core.disabled_components)) for chunk in chunks)
+    timings = time_runs(read, repeats)
+    mode = "batched" if batched else "unbatched"
+    return {
+        "name": "nlp/" + core.lang + "/" + os.path.basename(file_name) + "/" + size + "/" + mode,
+        "stage": "nlp", "model": core.lang, "file": os.path.basename(file_name), "size": size, "mode": mode,
+        "batch_size": core.batch_size if batched else 0, "chunks": len(chunks), "tokens": token_count[0],
+        "seconds": summarize(timings),
+        "chunks_per_second": summarize([len(chunks) / seconds for seconds in timings]),
+        "tokens_per_second": summarize([token_count[0] / seconds for seconds in timings])
+    }
+
+
+def _init_thread_worker(threads, core_shares):
+    # Thread benchmark process initializer. Pins the process to its own cores and limits its threads before its
+    # pipeline is loaded, as BLAS libraries only read their thread limits when first imported.
+    ner_core.limit_threads(threads)
+    ner_core.pin_to_cores(core_shares.get(timeout=10))
+
+
+def _time_thread_worker(model_name, file_name, size, batch_size, repeats):
+    # Times passing the given file's chunks through the given pipeline in a thread benchmark process. Returns a
+    # [token count, timings] pair, or None if the pipeline is not installed.
+    core = NER_Core()
+    core.lang = model_name
+    core.suffix = ""
+    core.batch_size = batch_size
+    try:
+        core.load_nlp()
+    except OSError:
+        return None
+    chunks = chunk_file(file_name, size)
+    token_count = [0]
+
+    def read():
+        token_count[0] = sum(len(doc) for doc in core.pipe_texts(chunks))
+    timings = time_runs(read, repeats)
+    return [token_count[0], timings]
+
+
+def benchmark_threads(model_name, threads, file_name, size, batch_size, repeats, max_processes=0):
+    # Times the given pipeline limited to the given number of threads per process, running as many processes side by
+    # side as the available cores hold, or at most the given number if not 0, each pinned to its own cores. Processes
+    # are started afresh so the thread limit applies before their pipeline loads. Returns a result entry, or None if
+    # the pipeline is not installed.
+    cores = ner_core.available_cores()
+    processes = max(1, len(cores) // threads)
+    if max_processes > 0:
+        processes = min(processes, max_processes)
+    context = multiprocessing.get_context("spawn")
+    core_shares = context.Queue()
+    for process in range(processes):
+        core_shares.put(cores[process * threads:(process + 1) * threads] or cores)
+    with concurrent.futures.ProcessPoolExecutor(processes, mp_context=context, initializer=_init_thread_worker,
+                                                initargs=(threads, core_shares)) as pool:
+        futures = [pool.submit(_time_thread_worker, model_name, file_name, size, batch_size, repeats)
+                   for _ in range(processes)]
+        outcomes = [future.result() for future in futures]
+    if None in outcomes:
+        return None
+    token_count = outcomes[0][0]
+    timings = [seconds for [_, process_timings] in outcomes for seconds in process_timings]
+    # Each run's host throughput is the tokens every process read in that run
+    host_rates = [sum(token_count / process_timings[run] for [_, process_timings] in outcomes)
+                  for run in range(repeats)]
+    return {
+        "name": "threads/" + model_name + "/" + str(threads),
+        "stage": "threads", "model": model_name, "file": os.path.basename(file_name), "size": size,
+        "threads": threads, "processes": processes, "batch_size": batch_size, "tokens": token_count,
+        "seconds": summarize(timings),
+        "tokens_per_second": summarize([token_count / seconds for seconds in timings]),
+        "host_tokens_per_second": summarize(host_rates)
+    }
+
+
+def best_thread_settings(results):
+    # Returns the thread benchmark entry with the highest median host throughput for each pipeline.
+    best = {}
+    for entry in results["results"]:
+        if entry["stage"] != "threads":
+            continue
+        previous = best.get(entry["model"])
+        if previous is None or entry["host_tokens_per_second"]["median"] > previous["host_tokens_per_second"]["median"]:
+            best[entry["model"]] = entry
+    return best
+
+
+def environment():
+    # Returns a description of the benchmarking environment, so results from different machines are not confused.
+    import spacy  # Imported here, as thread benchmark processes must limit their threads before importing it
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "available_cores": len(ner_core.available_cores()),
+        "spacy": spacy.__version__
+    }
+
+
+def run_benchmarks(files=benchmark_files, sizes=benchmark_sizes, models=benchmark_models, repeats=benchmark_repeats,
+                   batch_size=benchmark_batch_size, display=True, thread_counts=None,
+                   transformer_batch_size=benchmark_transformer_batch_size):
+    # Runs every benchmark and returns the results dictionary. Pipelines that are not installed are listed as skipped.
+    # Thread counts default to default_thread_counts(); an empty list skips the thread benchmarks.
+    if thread_counts is None:
+        thread_counts = default_thread_counts()
+    results = {"environment": environment(), "settings": {"files": list(files), "sizes": list(sizes),
+               "models": list(models), "repeats": repeats, "batch_size": batch_size,
+               "threads": list(thread_counts), "transformer_batch_size": transformer_batch_size},
+               "results": [], "skipped": []}
+
+    def record(entry):
+        results["results"].append(entry)
+        if display:
+            displayEntry(entry)
+
+    for [name, arguments] in startup_arguments.items():
+        record(benchmark_startup(name, arguments, repeats))
+    chunk_lists = {}
+    for file_name in files:
+        for size in sizes:
+            record(benchmark_chunking(file_name, size, repeats))
+            chunk_lists[(file_name, size)] = chunk_file(file_name, size)
+    for model_name in models:
+        load_entry = benchmark_model_load(model_name, repeats)
+        if load_entry is None:
+            results["skipped"].append(model_name)
+            if display:
+                print("Run info: Skipped \"" + model_name + "\", the pipeline is not installed.")
+            continue
+        record(load_entry)
+        core = NER_Core()
+        core.lang = model_name
+        core.suffix = ""
+        core.batch_size = batch_size
+        core.initialize_nlp()
+        for file_name in files:
+            for size in sizes:
+                for batched in [False, True]:
+                    record(benchmark_nlp(core, file_name, size, chunk_lists[(file_name, size)], batched, repeats))
+        model_batch_size = transformer_batch_size if model_name.endswith("_trf") else batch_size
+        for threads in thread_counts:
+            record(benchmark_threads(model_name, threads, thread_benchmark_file, thread_benchmark_size,
+                                     model_batch_size, repeats))
+    if display:
+        for [model_name, entry] in best_thread_settings(results).items():
+            print("Run info: Best throughput for \"%s\": %d threads in each of %d processes, %.1f tokens/s." %
+                  (model_name, entry["threads"], entry["processes"], entry["host_tokens_per_second"]["median"]))
+    return results
+
+
+def displayEntry(entry):
+    # Prints one result entry's median time and rate, with the spread of its runs.
+    seconds = entry["seconds"]
+    line = "%-62s %9.4f s (+/- %.4f)" % (entry["name"], seconds["median"], seconds["stdev"])
+    for metric in rate_metrics:
+        if metric in entry:
+            line += "  %12.1f %s" % (entry[metric]["median"], metric.replace("_per_second", "/s"))
+    print(line)
+
+
+def compare_to_baseline(results, baseline, tolerance=regression_tolerance):
+    # Compares the medians of every result entry against the entry of the same name in a baseline results dictionary.
+    # Returns a description of each median that worsened by more than the given percent: rates that fell, or times
+    # that rose.
+    baseline_entries = {entry["name"]: entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results["results"]:
+        baseline_entry = baseline_entries.get(entry["name"])
+        if baseline_entry is None:
+            continue
+        # Entries without rates, start-up and model load, are compared by time
+        metrics = [metric for metric in rate_metrics if metric in entry] or ["seconds"]
+        for metric in metrics:
+            current = entry[metric]["median"]
+            previous = baseline_entry[metric]["median"]
+            if previous <= 0:
+                continue
+            change = (current - previous) / previous * 100
+            if (metric == "seconds" and change > tolerance) or (metric != "seconds" and change < -tolerance):
+                regressions.append("%s %s: %.4g -> %.4g (%+.1f%%)" % (entry["name"], metric, previous, current,
+                                                                    change))
+    return regressions
+
+
+def parseBenchmarkArguments(arguments):
+    # Parses benchmark console input. Returns a dictionary of settings, or None if the arguments could not be
+    # interpreted. List flags take every argument up to the next flag.
+    settings = {"files": [], "sizes": [], "models": [], "threads": [], "repeats": benchmark_repeats,
+                "batch_size": benchmark_batch_size, "transformer_batch_size": benchmark_transformer_batch_size,
+                "output": "", "baseline": "", "tolerance": regression_tolerance}
+    list_flags = {"-f": "files", "-s": "sizes", "-m": "models", "-t": "threads"}
+    int_flags = {"-r": "repeats", "-b": "batch_size", "-tb": "transformer_batch_size", "-tolerance": "tolerance"}
+    file_flags = {"-o": "output", "-baseline": "baseline"}
+    while len(arguments) > 0:
+        flag = arguments[0]
+        values = []
+        for argument in arguments[1:]:
+            if argument[0] == '-':
+                break
+            values.append(argument)
+        if len(values) == 0:
+            print("Parse error: \"" + flag + "\" needs at least one argument; none were given.")
+            return None
+        if flag == "-t" and not all(value.isdigit() and int(value) > 0 for value in values):
+            print("Parse error: \"-t\" thread counts must be positive integers.")
+            return None
+        if flag == "-t":
+            values = [int(value) for value in values]
+        if flag in list_flags:
+            settings[list_flags[flag]] += values
+            arguments = arguments[1 + len(values):]
+            continue
+        value = values[0]
+        if flag in int_flags and value.isdigit() and int(value) > 0:
+            settings[int_flags[flag]] = int(value)
+        elif flag in file_flags:
+            settings[file_flags[flag]] = value
+        else:
+            print("Parse error: unrecognized flag or argument \"" + flag + " " + value + "\".")
+            return None
+        arguments = arguments[2:]
+    settings["files"] = settings["files"] or benchmark_files
+    settings["sizes"] = settings["sizes"] or benchmark_sizes
+    settings["models"] = settings["models"] or benchmark_models
+    settings["threads"] = settings["threads"] or default_thread_counts()
+    return settings
+
+
+if __name__ == '__main__':
+    # Main function call
+    settings = parseBenchmarkArguments(sys.argv[1:])
+    if settings is None:
+        sys.exit(2)
+    print("---------- Grier-NER Benchmark ----------")
+    results = run_benchmarks(settings["files"], settings["sizes"], settings["models"], settings["repeats"],
+                             settings["batch_size"], thread_counts=settings["threads"],
+                             transformer_batch_size=settings["transformer_batch_size"])
+    if settings["output"] != "":
+        with open(settings["output"], "w", encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+        print("Run info: Results written to " + settings["output"] + ".")
+    if settings["baseline"] != "":
+        with open(settings["baseline"], "r", encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_to_baseline(results, baseline, settings["tolerance"])
+        print("---------- Regressions Against " + settings["baseline"] + " ----------")
+        for regression in regressions:
+            print(regression)
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("None.")
@@ -0,0 +1,97 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# On-disk, content-addressed cache of the tokens NER_Core extracts from each chunk of text. Entries are keyed by a hash
+# of the chunk's text together with the pipeline's name and version and the desired part-of-speech, so a chunk that was
+# already read by the same pipeline, from any file or website, skips the NLP model entirely.
+import os  # Used to create the cache's directory
+import json  # Used to store token lists
+import time  # Used to order entries by last use
+import sqlite3  # Used to store cache entries
+import hashlib  # Used to hash chunk text into cache keys
+
+cache_size_limit = 1024 * 1024 * 1024  # Default most bytes of tokens kept in a cache before evicting entries
+cache_commit_interval = 64  # Number of stored entries between commits to disk
+
+
+class NER_Result_Cache:
+    # Cache database of extracted tokens. When the stored tokens pass the size limit, the least recently used entries
+    # are evicted until the cache is back under 90% of the limit.
+
+    def __init__(self, file_name, size_limit=cache_size_limit):
+        directory = os.path.dirname(file_name)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        self.size_limit = size_limit
+        self.connection = sqlite3.connect(file_name, timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, tokens TEXT NOT NULL, "
+                                "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, model_name, model_version, desired_POS, text):
+        # Returns the cache key for the given chunk text read by the given pipeline.
+        key_hash = hashlib.sha256()
+        for part in [model_name, model_version, desired_POS]:
+            key_hash.update(part.encode('utf-8') + b"\0")
+        key_hash.update(text.encode('utf-8'))
+        return key_hash.hexdigest()
+
+    def lookup(self, key):
+        # Returns the list of tokens stored for the given key, or None if there is no entry.
+        row = self.connection.execute("SELECT tokens FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.count_change()
+        return json.loads(row[0])
+
+    def take_counts(self):
+        # Returns the [hits, misses] counts since they were last taken, and resets them. Used to return a worker
+        # process's counts to the main process.
+        counts = [self.hits, self.misses]
+        self.hits = self.misses = 0
+        return counts
+
+    def store(self, key, tokens):
+        # Stores the given list of tokens under the given key, evicting old entries if the cache is over its limit.
+        stored_tokens = json.dumps(tokens)
+        size = len(stored_tokens) + len(key)
+        replaced = self.connection.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+        if replaced is not None:
+            self.size -= replaced[0]
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                (key, stored_tokens, size, time.time()))
+        self.size += size
+        if self.size > self.size_limit:
+            self.evict()
+        self.count_change()
+
+    def evict(self):
+        # Deletes the least recently used entries until the cache is under 90% of its size limit.
+        cursor = self.connection.execute("SELECT key, size FROM results ORDER BY last_used")
+        evicted_keys = []
+        for [key, size] in cursor:
+            if self.size <= 0.9 * self.size_limit:
+                break
+            evicted_keys.append((key,))
+            self.size -= size
+        cursor.close()
+        self.connection.executemany("DELETE FROM results WHERE key = ?", evicted_keys)
+
+    def count_change(self):
+        # Commits changes to disk every so often, rather than after every change.
+        self.uncommitted += 1
+        if self.uncommitted >= cache_commit_interval:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        # Commits any remaining changes and closes the cache database.
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,263 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Compact binary output of NER_Core's "-columns" mode. Every match found is stored as a row of four columns: its token,
+# part-of-speech (or entity label), document and character offset. Tokens, parts-of-speech and document names are
+# stored once each in string dictionaries, and rows only hold their ids, so a corpus-level run takes a fraction of the
+# space of plain text and never has to be parsed again.
+#
+# File layout, all integers little-endian:
+#   magic "GRIERCOL", version (u32)
+#   batches, each: row count (u32), token ids (u32 each), part-of-speech ids (u16 each), padding to 4 bytes,
+#                  document ids (u32 each), padding to 8 bytes, offsets (u64 each)
+#   footer: model name, then the token, part-of-speech and document dictionaries, each a string count (u32) followed
+#           by length-prefixed (u32) UTF-8 strings; the count of each token (u64 each); the batch count (u32) and the
+#           file offset of each batch (u64 each)
+#   file offset of the footer (u64), magic "GRIERCOL"
+# Rows are written in batches through a buffered file, and the reader memory-maps the file and views each column in
+# place, without reading or copying it.
+import sys  # Used to check the machine's byte order
+import mmap  # Used to read column files without copying them
+import array  # Used to buffer columns while writing
+import struct  # Used to encode lengths and offsets
+import weakref  # Used to release column views on closing
+import functools  # Used to forget column views once they are freed
+
+column_magic = b"GRIERCOL"
+column_version = 1
+column_batch_rows = 65536  # Rows buffered before a batch is written
+# Type codes of the token, part-of-speech, document and offset columns
+column_types = ["I", "H", "I", "Q"]
+
+
+def padding(position, alignment):
+    # Returns the number of bytes needed to align the given position.
+    return -position % alignment
+
+
+class NER_Column_Writer:
+    # Writes rows to a column file. Rows are buffered and written a batch at a time; close() writes the last batch and
+    # the footer, without which the file cannot be read.
+
+    def __init__(self, file_name, model_name="", batch_rows=column_batch_rows):
+        self.file = open(file_name, "wb", buffering=1 << 20)
+        self.file.write(column_magic + struct.pack("<I", column_version))
+        self.model_name = model_name
+        self.batch_rows = batch_rows
+        self.token_ids = {}
+        self.pos_ids = {}
+        self.documents = []
+        self.counts = array.array("Q")  # Token id -> number of rows
+        self.columns = [array.array(type_code) for type_code in column_types]
+        self.batch_offsets = []
+
+    def add_document(self, name):
+        # Registers a document and returns its id.
+        self.documents.append(name)
+        return len(self.documents) - 1
+
+    def add(self, token, pos, document_id, offset):
+        # Buffers a row, writing the batch once it is full.
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = self.token_ids[token] = len(self.token_ids)
+            self.counts.append(0)
+        self.counts[token_id] += 1
+        pos_id = self.pos_ids.get(pos)
+        if pos_id is None:
+            pos_id = self.pos_ids[pos] = len(self.pos_ids)
+        for [column, value] in zip(self.columns, (token_id, pos_id, document_id, offset)):
+            column.append(value)
+        if len(self.columns[0]) >= self.batch_rows:
+            self.write_batch()
+
+    def write_batch(self):
+        # Writes the buffered rows as a batch.
+        rows = len(self.columns[0])
+        if rows == 0:
+            return
+        self.batch_offsets.append(self.file.tell())
+        self.file.write(struct.pack("<I", rows))
+        for [column, alignment] in zip(self.columns, (4, 4, 8, 8)):
+            self.file.write(b"\0" * padding(self.file.tell(), alignment))
+            if sys.byteorder != "little":
+                column.byteswap()
+            self.file.write(column.tobytes())
+        self.columns = [array.array(type_code) for type_code in column_types]
+
+    def write_strings(self, strings):
+        self.file.write(struct.pack("<I", len(strings)))
+        for string in strings:
+            encoded = string.encode("utf-8")
+            self.file.write(struct.pack("<I", len(encoded)) + encoded)
+
+    def close(self):
+        # Writes the last batch and the footer, and closes the file.
+        self.write_batch()
+        footer_offset = self.file.tell()
+        self.write_strings([self.model_name])
+        self.write_strings(list(self.token_ids))
+        self.write_strings(list(self.pos_ids))
+        self.write_strings(self.documents)
+        if sys.byteorder != "little":
+            self.counts.byteswap()
+        self.file.write(self.counts.tobytes())
+        self.file.write(struct.pack("<I", len(self.batch_offsets)))
+        self.file.write(struct.pack("<%dQ" % len(self.batch_offsets), *self.batch_offsets))
+        self.file.write(struct.pack("<Q", footer_offset) + column_magic)
+        self.file.close()
+
+
+class NER_Column_Reader:
+    # Memory-maps a column file written by NER_Column_Writer. Dictionaries are decoded on opening; the columns of each
+    # batch are viewed in the mapped file, and token lookups search the token column without decoding any row. Column
+    # views returned by batch_columns() and view() are only valid until close(), which releases them; copy any needed
+    # afterwards, ex. with list(). Can be used as a context manager, closing on exit.
+
+    def __init__(self, file_name):
+        with open(file_name, "rb") as column_file:
+            self.map = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:8] != column_magic or self.map[-8:] != column_magic:
+            self.map.close()
+            raise ValueError("\"" + file_name + "\" is not a complete column file.")
+        self.buffer = memoryview(self.map)
+        self.views = {}  # id -> weak reference of each column view handed out and not yet freed, released on closing
+        [self.version] = struct.unpack_from("<I", self.map, 8)
+        [self.position] = struct.unpack_from("<Q", self.map, len(self.map) - 16)
+        [self.model_name] = self.read_strings()
+        self.token_list = self.read_strings()
+        self.pos_list = self.read_strings()
+        self.documents = self.read_strings()
+        self.token_ids = {token: token_id for [token_id, token] in enumerate(self.token_list)}
+        self.counts = self.read_array("Q", len(self.token_list))
+        [batch_count] = struct.unpack_from("<I", self.map, self.position)
+        self.batches = struct.unpack_from("<%dQ" % batch_count, self.map, self.position + 4)
+        self.position = None
+
+    @staticmethod
+    def is_column_file(file_name):
+        # Returns whether the given file starts like a column file.
+        with open(file_name, "rb") as column_file:
+            return column_file.read(len(column_magic)) == column_magic
+
+    def read_strings(self):
+        # Decodes a string dictionary at the read position and moves past it.
+        [count] = struct.unpack_from("<I", self.map, self.position)
+        self.position += 4
+        strings = []
+        for _ in range(count):
+            [length] = struct.unpack_from("<I", self.map, self.position)
+            strings.append(self.map[self.position + 4:self.position + 4 + length].decode("utf-8"))
+            self.position += 4 + length
+        return strings
+
+    def read_array(self, type_code, length):
+        # Returns a view of the given number of integers at the read position and moves past them.
+        start = self.position
+        self.position += length * struct.calcsize(type_code)
+        return self.view(type_code, start, self.position)
+
+    def view(self, type_code, start, end):
+        # Returns the little-endian integers between the given file offsets, viewed in place where the machine's byte
+        # order allows it, or copied otherwise.
+        if sys.byteorder == "little":
+            view = self.buffer[start:end].cast(type_code)
+            self.views[id(view)] = weakref.ref(view, functools.partial(self.views.pop, id(view)))
+            return view
+        values = array.array(type_code, self.map[start:end])
+        values.byteswap()
+        return values
+
+    def batch_columns(self, batch_offset):
+        # Returns [token ids, part-of-speech ids, document ids, offsets] views of the batch at the given file offset.
+        [rows] = struct.unpack_from("<I", self.map, batch_offset)
+        position = batch_offset + 4
+        columns = []
+        for [type_code, alignment] in zip(column_types, (4, 4, 8, 8)):
+            position += padding(position, alignment)
+            end = position + rows * struct.calcsize(type_code)
+            columns.append(self.view(type_code, position, end))
+            position = end
+        return columns
+
+    def rows(self):
+        # Generator over [token, part-of-speech, document name, offset] rows, in the order they were written.
+        for batch_offset in self.batches:
+            [tokens, pos, documents, offsets] = self.batch_columns(batch_offset)
+            for row in range(len(tokens)):
+                yield [self.token_list[tokens[row]], self.pos_list[pos[row]], self.documents[documents[row]],
+                       offsets[row]]
+
+    def tokens(self, pos=None):
+        # Returns the unique tokens, or only those stored under the given part-of-speech, in alphabetical order.
+        if pos is None:
+            return sorted(self.token_list)
+        return sorted(self.pos_counts(pos))
+
+    def pos_counts(self, pos):
+        # Returns a dictionary of how many rows hold each token stored under the given part-of-speech.
+        if pos not in self.pos_list:
+            return {}
+        if len(self.pos_list) == 1:
+            # Every row is stored under it
+            return {token: self.counts[token_id] for [token_id, token] in enumerate(self.token_list)}
+        pos_id = self.pos_list.index(pos)
+        counts = {}
+        for batch_offset in self.batches:
+            [tokens, pos_ids, _, _] = self.batch_columns(batch_offset)
+            for row in range(len(tokens)):
+                if pos_ids[row] == pos_id:
+                    counts[tokens[row]] = counts.get(tokens[row], 0) + 1
+        return {self.token_list[token_id]: count for [token_id, count] in counts.items()}
+
+    def count(self, token):
+        # Returns how many rows hold the given token.
+        token_id = self.token_ids.get(token)
+        return self.counts[token_id] if token_id is not None else 0
+
+    def occurrences(self, token):
+        # Returns a [document name, offset] pair for each row holding the given token. The token column of each batch
+        # is searched for the token's id as raw bytes, so only matching rows are decoded.
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            return []
+        pattern = struct.pack("<I", token_id)
+        found = []
+        for batch_offset in self.batches:
+            [rows] = struct.unpack_from("<I", self.map, batch_offset)
+            start = batch_offset + 4
+            end = start + 4 * rows
+            columns = None
+            position = self.map.find(pattern, start, end)
+            while position != -1:
+                if (position - start) % 4 == 0:
+                    if columns is None:
+                        columns = self.batch_columns(batch_offset)
+                    row = (position - start) // 4
+                    found.append([self.documents[columns[2][row]], columns[3][row]])
+                    position += 4
+                else:
+                    position += 1
+                position = self.map.find(pattern, position, end)
+        return found
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # Releases every column view handed out and unmaps the file. Views a caller took of those views cannot be
+        # released here, so if any are left the file is unmapped once they are freed instead.
+        self.counts = None
+        for reference in list(self.views.values()):
+            view = reference()
+            if view is not None:
+                view.release()
+        self.buffer.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        self.map = None
@@ -1,10 +1,124 @@
 # Author: Michael Fuhrer
 # Created: 2021-03-23   Last Updated: 2021-04-01
 # Primary NER tool. Contains input parsing logic to set up NLP model as well as functions to initialize and operate
-# article reader and NLP model according to input instructions.
-import spacy  # Main NPL interpreter
+# article reader and NLP model according to input instructions. spaCy is only imported when a pipeline is first loaded,
+# so parsing arguments and displaying errors never pay for importing it.
+import os  # Used to expand directories of input files
+import glob  # Used to expand wildcard patterns of input files
+import concurrent.futures  # Used to shard documents across worker processes
+import multiprocessing  # Used to hand pinned worker processes their cores
+import queue  # Used to tell when every worker's cores were handed out
+import collections  # Used to order the model cache by recent use
+import threading  # Used to guard the model cache
+import time  # Used to time chunk size calibration and wait between follow rounds
 import sortedcontainers  # Used to organized desired tokens
-from article_handler import NER_Article_Reader
+import sys  # Used to stream entities to the console
+import json  # Used to format streamed entities
+import hashlib  # Used to name saved website text
+import cProfile  # Used to profile runs
+import contextlib  # Used to skip stage timing when statistics are off
+from article_handler import NER_Article_Reader, NER_Mapped_Reader, NER_Web_Fetcher
+from ner_cache import NER_Result_Cache, cache_size_limit
+from ner_index import NER_POS_Index
+from ner_columns import NER_Column_Writer, NER_Column_Reader
+from ner_aggregate import NER_Spill_Set, NER_Top_K
+from ner_stats import NER_Stats
+from ner_language import detect_language
+from ner_prefilter import NER_Prefilter
+from ner_dedup import NER_Dedup
+
+follow_interval = 1.0  # Default seconds between checks for appended text in "-follow" mode
+held_text_timeout = 30.0  # Seconds a file must go unchanged before the text held back at its end is read anyway
+shard_size = 32  # Number of chunks sent to a worker process at a time when running in parallel
+target_piece_size = 1024  # Size limit of the pieces joined into chunks when chunking toward a sentence/token target
+
+# Chunk sizes tried by "-calibrate", in "-s" format: a size limit in characters, or a target number of sentences ("s")
+# or tokens ("t") per chunk.
+calibration_sizes = ["1024", "2048", "4092", "8184", "16368", "10s", "25s", "50s", "250t", "1000t"]
+calibration_sample_size = 65536  # Characters of input text timed at each calibration size
+
+# spaCy pipeline components that token.pos_ depends on. The tagger/morphologizer predict fine-grained tags, the
+# attribute ruler maps them onto coarse part-of-speech tags, and tok2vec/transformer provide their embeddings. Any other
+# component, ex. the parser, lemmatizer or NER, is disabled while reading.
+pos_components = ["tok2vec", "transformer", "tagger", "morphologizer", "attribute_ruler"]
+# spaCy pipeline components that doc.ents depends on, used instead of the above when extracting entities.
+entity_components = ["tok2vec", "transformer", "ner", "entity_ruler"]
+
+# Environment variables that cap the threads BLAS and OpenMP libraries use for a single operation. They are read when
+# the libraries are first imported, which only happens once a pipeline is loaded.
+thread_env_vars = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+_thread_limit = 0  # Threads per operation set by limit_threads(); 0 leaves each library's default
+
+model_cache_size = 4  # Number of loaded spaCy pipelines kept in memory for reuse by new cores
+_model_cache = collections.OrderedDict()  # Pipeline name -> loaded pipeline, least recently used first
+_model_cache_lock = threading.Lock()
+
+
+def load_pipeline(model_name):
+    # Returns the spaCy pipeline with the given name, loading it from disk only if it is not already cached. Cores
+    # never modify a pipeline (disabled components are skipped per call), so a cached pipeline is safe to share. When
+    # the cache is full, the least recently used pipeline is evicted.
+    with _model_cache_lock:
+        if model_name in _model_cache:
+            _model_cache.move_to_end(model_name)
+            return _model_cache[model_name]
+        import spacy  # Main NPL interpreter
+        nlp = spacy.load(model_name)
+        _limit_torch_threads()
+        _model_cache[model_name] = nlp
+        while len(_model_cache) > model_cache_size:
+            _model_cache.popitem(last=False)
+        return nlp
+
+
+def limit_threads(threads):
+    # Limits the threads the NLP libraries of this process use for a single operation: BLAS/OpenMP through their
+    # environment variables, which only take effect if set before the first pipeline is loaded, and PyTorch, used by
+    # transformer pipelines, directly.
+    global _thread_limit
+    _thread_limit = threads
+    for name in thread_env_vars:
+        os.environ[name] = str(threads)
+    _limit_torch_threads()
+
+
+def _limit_torch_threads():
+    # Applies the thread limit to PyTorch, if it has been imported.
+    if _thread_limit > 0 and "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(_thread_limit)
+
+
+def available_cores():
+    # Returns the CPU cores this process may run on.
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_to_cores(cores):
+    # Pins this process to the given CPU cores. Returns whether the platform supports pinning.
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    os.sched_setaffinity(0, cores)
+    return True
+
+
+def parse_cores(text):
+    # Returns the CPU cores listed in the given text, ex. "0-3,6", or None if it could not be interpreted.
+    cores = []
+    for part in text.split(","):
+        bounds = part.split("-")
+        if len(bounds) > 2 or not all(bound.isdigit() for bound in bounds) or int(bounds[0]) > int(bounds[-1]):
+            return None
+        cores += range(int(bounds[0]), int(bounds[-1]) + 1)
+    return sorted(set(cores))
+
+
+def clear_model_cache():
+    # Drops every cached pipeline, so the next core to initialize loads its pipeline from disk again.
+    with _model_cache_lock:
+        _model_cache.clear()
 
 lang_dict = {
     # English
@@ -24,6 +138,7 @@ lang_dict = {
     # Italian
     "italian": "it_core_news",
     "italiano": "it_core_news",
+    "it": "it_core_news",
     "it_core_news_sm": "it_core_news"
     # Multi-Language [untested]
     # "multi-language": "xx",
@@ -109,7 +224,8 @@ class NER_Core:
 
     def file_flag(self, arguments):
         # Handles "-f" flag behavior, which specifies a file to be read by the core. Requires one argument.
-        if len(arguments) > 0 and arguments[0][0] != '-' and self.website == "" and self.read_file == "":
+        if len(arguments) > 0 and arguments[0][0] != '-' and self.website == "" and self.read_file == "" and \
+                self.url_list == "":
             # Valid input
             self.read_file = arguments[0]
             return [True, arguments[1:]]
@@ -118,7 +234,7 @@ class NER_Core:
             if len(arguments) == 0 or (len(arguments) > 0 and arguments[0][0] == '-'):
                 # Flag needs one argument, none were given.
                 print("Parse error: \"-f\" needs one argument; none were given.")
-            elif self.website != "":
+            elif self.website != "" or self.url_list != "":
                 # Already specified a website to scrape from
                 print("Parse error: \"-f\" cannot read file. Already specified a website to read from.")
             else:
@@ -143,8 +259,12 @@ class NER_Core:
             return [False, arguments]
 
     def lang_flag(self, arguments):
-        # Handles "-l" flag behavior, which specifies the language the NLP model will operate under. Requires one
-        # argument.
+        # Handles "-l" flag behavior, which specifies the language the NLP model will operate under, or "auto" to detect
+        # the language of each chunk. Requires one argument.
+        if len(arguments) > 0 and arguments[0].lower() == "auto":
+            # Language detected per chunk
+            self.auto_lang = True
+            return [True, arguments[1:]]
         if len(arguments) > 0 and (arguments[0].lower() in lang_dict):
             # Valid input
             self.lang = lang_dict[arguments[0].lower()]
@@ -162,7 +282,7 @@ class NER_Core:
     def web_flag(self, arguments):
         # Handles "-web" flag behavior, which specifies the website the reader will scrape from and which file to save
         # the text into. Requires two arguments.
-        if len(arguments) > 1 and arguments[0][0] != '-' and arguments[1][0] != '-' and self.read_file == "" and self.website == "":
+        if len(arguments) > 1 and arguments[0][0] != '-' and arguments[1][0] != '-' and self.read_file == "" and self.website == "" and self.url_list == "":
             # Valid input
             self.website = arguments[0]
             self.read_file = arguments[1]
@@ -172,7 +292,7 @@ class NER_Core:
             if len(arguments) < 2 or (len(arguments) > 1 and (arguments[0][0] == '-' or arguments[1][0] == '-')):
                 # Flag needs two arguments, not enough were given
                 print("Parse error: \"-web\" needs two arguments: website and filename.")
-            elif self.website != "":
+            elif self.website != "" or self.url_list != "":
                 # Already specified a website to scrape from
                 print("Parse error: Multiple instances of \"-web\"")
             else:
@@ -180,12 +300,71 @@ class NER_Core:
                 print("Parse error: \"-web\" cannot read site. Already specified a file to read from.")
             return [False, arguments]
 
+    def urls_flag(self, arguments):
+        # Handles "-urls" flag behavior, which specifies a file listing websites, one per line, to be scraped
+        # concurrently and parsed as they arrive. Requires one argument, plus an optional directory to save each
+        # website's text into.
+        if len(arguments) > 0 and arguments[0][0] != '-' and self.read_file == "" and self.website == "" and self.url_list == "":
+            # Valid input
+            self.url_list = arguments[0]
+            if len(arguments) > 1 and arguments[1][0] != '-':
+                # Save directory given
+                self.url_save_dir = arguments[1]
+                return [True, arguments[2:]]
+            return [True, arguments[1:]]
+        else:
+            # Invalid Input
+            if len(arguments) == 0 or (len(arguments) > 0 and arguments[0][0] == '-'):
+                # Flag needs one argument, none were given
+                print("Parse error: \"-urls\" needs one argument; none were given.")
+            elif self.url_list != "":
+                # Already specified a list of websites
+                print("Parse error: Multiple instances of \"-urls\"")
+            else:
+                # Already specified a file or website to read from
+                print("Parse error: \"-urls\" cannot read sites. Already specified a file or website to read from.")
+            return [False, arguments]
+
     def acc_flag(self, arguments):
         # Handles "-a" flag behavior, which selects the more accurate, but less efficient NLP model. Doesn't require
         # any arguments.
         self.suffix = "_trf"
         return [True, arguments]
 
+    def threads_flag(self, arguments):
+        # Handles "-threads" flag behavior, which limits the threads each process's NLP model uses for a single
+        # operation. Requires one argument.
+        threads = self.positive_int_flag("-threads", arguments)
+        if threads is None:
+            return [False, arguments]
+        self.threads = threads
+        return [True, arguments[1:]]
+
+    def pin_flag(self, arguments):
+        # Handles "-pin" flag behavior, which pins the process to CPU cores, or with "-j", each worker to its own share
+        # of them. Optionally accepts the cores, ex. "0-3,6"; every available core is used otherwise.
+        if not hasattr(os, "sched_setaffinity"):
+            print("Parse error: \"-pin\" is not supported on this platform.")
+            return [False, arguments]
+        cores = parse_cores(arguments[0]) if len(arguments) > 0 else None
+        if cores is not None:
+            if not set(cores) <= set(available_cores()):
+                print("Parse error: \"-pin\" cores \"" + arguments[0] + "\" are not available cores.")
+                return [False, arguments]
+            self.pin_cores = cores
+            return [True, arguments[1:]]
+        self.pin_cores = available_cores()
+        return [True, arguments]
+
+    def transformer_batch_flag(self, arguments):
+        # Handles "-tb" flag behavior, which sets the nlp.pipe() batch size used instead of "-b" when the pipeline is a
+        # transformer. Requires one argument.
+        batch_size = self.positive_int_flag("-tb", arguments)
+        if batch_size is None:
+            return [False, arguments]
+        self.transformer_batch_size = batch_size
+        return [True, arguments[1:]]
+
     def file_write_flag(self, arguments):
         # Handles "-w" flag behavior, which specifies a file to be written to by the core. Requires one argument.
         if len(arguments) > 0 and arguments[0][0] != '-' and self.save_file == "":
@@ -202,33 +381,309 @@ class NER_Core:
                 print("Parse error: Multiple instances of \"-w\"")
             return [False, arguments]
 
+    def mmap_flag(self, arguments):
+        # Handles "-m" flag behavior, which memory-maps read files instead of reading them into strings. Doesn't
+        # require any arguments.
+        mapped_reader = NER_Mapped_Reader(size_limit=self.reader.chunk_size_limit)
+        mapped_reader.chunk_target = self.reader.chunk_target
+        mapped_reader.chunk_target_unit = self.reader.chunk_target_unit
+        self.reader = mapped_reader
+        return [True, arguments]
+
+    def size_flag(self, arguments):
+        # Handles "-s" flag behavior, which sets how chunks are sized. The argument is either a size limit in
+        # characters (ex. "4092"), or a target number of sentences (ex. "40s") or tokens (ex. "800t") to fill each chunk
+        # with. Requires one argument.
+        if len(arguments) > 0 and self.set_chunk_size(arguments[0]):
+            # Valid input
+            return [True, arguments[1:]]
+        else:
+            # Invalid input
+            if len(arguments) == 0 or (len(arguments) > 0 and arguments[0][0] == '-'):
+                # Flag needs one argument, none were given.
+                print("Parse error: \"-s\" needs one argument; none were given.")
+            else:
+                # Argument is not a size
+                print("Parse error: \"-s\" argument must be a positive integer, optionally followed by \"s\" or \"t\".")
+            return [False, arguments]
+
+    def calibrate_flag(self, arguments):
+        # Handles "-calibrate" flag behavior, which times a sample of the input at several chunk sizes before reading
+        # and reads with the fastest. Doesn't require any arguments.
+        self.calibrate = True
+        return [True, arguments]
+
+    def cache_flag(self, arguments):
+        # Handles "-cache" flag behavior, which specifies a result cache file that stores the tokens found in each
+        # chunk, so unchanged chunks skip the NLP model on later runs. Requires one argument, plus an optional size
+        # limit in megabytes.
+        if len(arguments) > 0 and arguments[0][0] != '-' and self.cache_file == "":
+            # Valid input
+            self.cache_file = arguments[0]
+            if len(arguments) > 1 and arguments[1].isdigit() and int(arguments[1]) > 0:
+                # Size limit given
+                self.cache_size_limit = int(arguments[1]) * 1024 * 1024
+                return [True, arguments[2:]]
+            return [True, arguments[1:]]
+        else:
+            # Invalid input
+            if len(arguments) == 0 or (len(arguments) > 0 and arguments[0][0] == '-'):
+                # Flag needs one argument, none were given.
+                print("Parse error: \"-cache\" needs one argument; none were given.")
+            else:
+                # Already specified a cache file
+                print("Parse error: Multiple instances of \"-cache\"")
+            return [False, arguments]
+
+    def entity_flag(self, arguments):
+        # Handles "-e" flag behavior, which extracts named entity spans, with their labels and offsets, rather than
+        # single tokens of a part-of-speech, and streams them out as JSON Lines while reading. Doesn't require any
+        # arguments.
+        self.entity_mode = True
+        return [True, arguments]
+
+    def spill_flag(self, arguments):
+        # Handles "-spill" flag behavior, which counts desired tokens in a hash map instead of a sorted set, spilling it
+        # to disk as sorted runs whenever it passes the given number of megabytes. Requires one argument.
+        megabytes = self.positive_int_flag("-spill", arguments)
+        if megabytes is None:
+            return [False, arguments]
+        if not isinstance(self.desired_tokens, NER_Top_K):
+            # Top-K counting already uses bounded memory
+            self.desired_tokens = NER_Spill_Set(megabytes * 1024 * 1024)
+        return [True, arguments[1:]]
+
+    def count_flag(self, arguments):
+        # Handles "-count" flag behavior, which counts how often each desired token occurs and lists tokens with their
+        # counts. Doesn't require any arguments.
+        self.count_tokens = True
+        if isinstance(self.desired_tokens, sortedcontainers.SortedSet):
+            self.desired_tokens = NER_Spill_Set()
+        return [True, arguments]
+
+    def top_flag(self, arguments):
+        # Handles "-top" flag behavior, which lists only the given number of most frequent desired tokens, with their
+        # counts, counted in bounded memory. Requires one argument.
+        k = self.positive_int_flag("-top", arguments)
+        if k is None:
+            return [False, arguments]
+        self.count_tokens = True
+        self.desired_tokens = NER_Top_K(k)
+        return [True, arguments[1:]]
+
+    def stats_flag(self, arguments):
+        # Handles "-stats" flag behavior, which times each stage of the run and counts what passed through it, and
+        # reports the statistics once the run finishes. Doesn't require any arguments.
+        self.stats = NER_Stats()
+        return [True, arguments]
+
+    def profile_flag(self, arguments):
+        # Handles "-profile" flag behavior, which profiles the run with cProfile and saves the profile into the given
+        # file. Requires one argument.
+        return self.single_file_flag("-profile", "profile_file", arguments)
+
+    def prefilter_flag(self, arguments):
+        # Handles "-prefilter" flag behavior, which skips chunks that cannot hold a desired token before they reach the
+        # NLP model. Optionally accepts a gazetteer file of known entities, one per line; chunks mentioning none of
+        # them are skipped too.
+        self.prefilter_chunks = True
+        if len(arguments) > 0 and arguments[0][0] != '-':
+            if not os.path.isfile(arguments[0]):
+                print("Parse error: \"-prefilter\" cannot find gazetteer file \"" + arguments[0] + "\".")
+                return [False, arguments]
+            self.gazetteer_file = arguments[0]
+            return [True, arguments[1:]]
+        return [True, arguments]
+
+    def dedup_flag(self, arguments):
+        # Handles "-dedup" flag behavior, which reads each repeated passage of text only once, replaying the tokens
+        # found in its first copy for every other copy. Optionally accepts "sentences" to split passages at sentences
+        # rather than paragraphs, and "near" to also catch near-duplicate passages.
+        self.dedup_unit = "paragraphs"
+        while len(arguments) > 0 and arguments[0] in ("paragraphs", "sentences", "near"):
+            if arguments[0] == "near":
+                self.dedup_near = True
+            else:
+                self.dedup_unit = arguments[0]
+            arguments = arguments[1:]
+        return [True, arguments]
+
+    def checkpoint_flag(self, arguments):
+        # Handles "-checkpoint" flag behavior, which only reads text appended to the "-f" files since the last run with
+        # the same checkpoint file, and records where reading stopped in it. Requires one argument.
+        return self.single_file_flag("-checkpoint", "checkpoint_file", arguments)
+
+    def follow_flag(self, arguments):
+        # Handles "-follow" flag behavior, which keeps checking the "-f" files for appended text, and a directory or
+        # wildcard pattern for new files, until interrupted. Optionally accepts the seconds to wait between checks.
+        self.follow = True
+        if len(arguments) > 0 and arguments[0][0] != '-':
+            try:
+                self.follow_interval = float(arguments[0])
+            except ValueError:
+                self.follow_interval = 0
+            if self.follow_interval <= 0:
+                print("Parse error: \"-follow\" needs a positive number of seconds.")
+                return [False, arguments]
+            return [True, arguments[1:]]
+        return [True, arguments]
+
+    def index_flag(self, arguments):
+        # Handles "-index" flag behavior, which tags every token of the text once and saves an index of the tokens of
+        # every part-of-speech, with their counts and offsets, into the given file. Requires one argument.
+        return self.single_file_flag("-index", "index_file", arguments)
+
+    def columns_flag(self, arguments):
+        # Handles "-columns" flag behavior, which saves every match, with its part-of-speech or entity label, document
+        # and offset, into the given file in a compact binary format. Requires one argument.
+        return self.single_file_flag("-columns", "column_file", arguments)
+
+    def query_flag(self, arguments):
+        # Handles "-query" flag behavior, which lists the desired part-of-speech's tokens from an index saved by
+        # "-index" or a column file saved by "-columns", without reading any text or loading the NLP model. Requires
+        # one argument.
+        return self.single_file_flag("-query", "query_file", arguments)
+
+    def single_file_flag(self, flag, attribute, arguments):
+        # Shared behavior for flags that set a single file name attribute.
+        if len(arguments) > 0 and arguments[0][0] != '-' and getattr(self, attribute) == "":
+            # Valid input
+            setattr(self, attribute, arguments[0])
+            return [True, arguments[1:]]
+        else:
+            # Invalid input
+            if len(arguments) == 0 or (len(arguments) > 0 and arguments[0][0] == '-'):
+                # Flag needs one argument, none were given.
+                print("Parse error: \"" + flag + "\" needs one argument; none were given.")
+            else:
+                # Already specified a file
+                print("Parse error: Multiple instances of \"" + flag + "\"")
+            return [False, arguments]
+
+    def positive_int_flag(self, flag, arguments):
+        # Shared behavior for flags that take a single positive integer argument. Returns the parsed integer, or None
+        # if the argument was missing or invalid.
+        if len(arguments) > 0 and arguments[0].isdigit() and int(arguments[0]) > 0:
+            # Valid input
+            return int(arguments[0])
+        if len(arguments) == 0 or (len(arguments) > 0 and arguments[0][0] == '-'):
+            # Flag needs one argument, none were given.
+            print("Parse error: \"" + flag + "\" needs one argument; none were given.")
+        else:
+            # Argument is not a positive integer
+            print("Parse error: \"" + flag + "\" argument must be a positive integer.")
+        return None
+
+    def batch_flag(self, arguments):
+        # Handles "-b" flag behavior, which streams file chunks through spaCy's nlp.pipe() in batches of the given
+        # size instead of calling the NLP model once per chunk. Requires one argument.
+        batch_size = self.positive_int_flag("-b", arguments)
+        if batch_size is None:
+            return [False, arguments]
+        self.batch_size = batch_size
+        return [True, arguments[1:]]
+
+    def jobs_flag(self, arguments):
+        # Handles "-j" flag behavior, which splits the input files into shards and processes them in the given number
+        # of worker processes. Requires one argument.
+        workers = self.positive_int_flag("-j", arguments)
+        if workers is None:
+            return [False, arguments]
+        self.workers = workers
+        return [True, arguments[1:]]
+
     # ---------------------------------- NER Core Class Functions ----------------------------------
     def __init__(self):
         # Default constructor
         self.read_file = ""
         self.website = ""
+        self.url_list = ""  # File listing websites to scrape concurrently
+        self.url_save_dir = ""  # Directory to save scraped website text into; empty doesn't save it
         self.save_file = ""
         self.text_arg = ""
         self.lang = "en_core_web"
         self.suffix = "_sm"
         self.desired_POS = "PROPN"
+        self.batch_size = 0  # Chunks per nlp.pipe() batch; 0 reads chunk by chunk
+        self.workers = 1  # Worker processes used to read files; 1 reads in this process
+        self.threads = 0  # Threads per operation of each process's NLP model; 0 leaves the libraries' defaults
+        self.pin_cores = []  # CPU cores the process, or its workers, are pinned to; empty doesn't pin
+        self.transformer_batch_size = 0  # Batch size used instead of batch_size for transformer pipelines; 0 doesn't
+        self.calibrate = False  # Whether to pick the fastest chunk size before reading
+        self.cache_file = ""  # Result cache file; empty doesn't cache results
+        self.cache_size_limit = cache_size_limit  # Most bytes of tokens kept in the result cache
+        self.cache = None  # Open NER_Result_Cache while reading
+        self.shard_cache_counts = None  # [hits, misses] of the "-j" workers' result caches, once any are returned
+        self.index_file = ""  # File to save a part-of-speech index into; empty doesn't build one
+        self.query_file = ""  # Saved part-of-speech index to list tokens from instead of reading text
+        self.index = None  # NER_POS_Index being built while reading
+        self.index_document = 0  # Index id of the document being read
+        self.column_file = ""  # File to save matches into in the binary column format; empty doesn't save them
+        self.columns = None  # NER_Column_Writer being written while reading
+        self.column_document = 0  # Column file id of the document being read
+        self.document_name = ""  # Name of the document being read
+        self.document_chunks = 0  # Chunks of the document read so far, numbering the chunks entities are found in
+        self.entity_mode = False  # Whether to extract named entity spans instead of tokens
+        self.entity_output = None  # Stream entities are written to while reading
+        self.count_tokens = False  # Whether desired tokens are counted and listed with their counts
+        self.stats = None  # NER_Stats timing the run; None skips timing entirely
+        self.auto_lang = False  # Whether each chunk is read by the pipeline of its detected language
+        self.language_chunks = {}  # Language code -> number of chunks read in it, when detecting languages
+        self.failed_languages = set()  # Language codes whose pipeline could not be loaded, when detecting languages
+        self.checkpoint_file = ""  # File recording where reading stopped in each file; empty reads files from the start
+        self.follow = False  # Whether to keep reading text appended to files until interrupted
+        self.follow_interval = follow_interval  # Seconds between checks for appended text when following
+        self.save_mode = "w"  # Mode the save file is opened in, appending when output is written in rounds
+        self.prefilter_chunks = False  # Whether chunks are pre-filtered before reaching the NLP model
+        self.gazetteer_file = ""  # File of known entities chunks must mention to reach the model; empty doesn't check
+        self.prefilter = None  # NER_Prefilter checking chunks while reading
+        self.dedup_unit = ""  # "paragraphs" or "sentences" to deduplicate passages of that size; empty doesn't
+        self.dedup_near = False  # Whether near-duplicate passages are deduplicated too
+        self.dedup = None  # NER_Dedup remembering passages while reading
+        self.profile_file = ""  # File to save a cProfile profile of the run into; empty doesn't profile
         self.reader = NER_Article_Reader()
         self.desired_tokens = sortedcontainers.SortedSet()  # Using sorted set to preserve uniqueness
         self.nlp = None
+        self.disabled_components = []  # Pipeline components skipped when calling the NLP model
         self.flag_dict = {
             "-f": self.file_flag,
             "-p": self.pos_flag,
             "-l": self.lang_flag,
             "-web": self.web_flag,
             "-a": self.acc_flag,
-            "-w": self.file_write_flag
+            "-w": self.file_write_flag,
+            "-b": self.batch_flag,
+            "-j": self.jobs_flag,
+            "-threads": self.threads_flag,
+            "-pin": self.pin_flag,
+            "-tb": self.transformer_batch_flag,
+            "-m": self.mmap_flag,
+            "-s": self.size_flag,
+            "-calibrate": self.calibrate_flag,
+            "-urls": self.urls_flag,
+            "-cache": self.cache_flag,
+            "-index": self.index_flag,
+            "-query": self.query_flag,
+            "-columns": self.columns_flag,
+            "-e": self.entity_flag,
+            "-spill": self.spill_flag,
+            "-count": self.count_flag,
+            "-top": self.top_flag,
+            "-stats": self.stats_flag,
+            "--stats": self.stats_flag,
+            "-profile": self.profile_flag,
+            "-checkpoint": self.checkpoint_flag,
+            "-follow": self.follow_flag,
+            "-prefilter": self.prefilter_flag,
+            "-dedup": self.dedup_flag
         }
 
     def initialize_nlp(self):
-        # Tries to load the spaCy pipeline. If it fails, function will notify user how to install the pipeline.
+        # Tries to load the spaCy pipeline, reusing it if another core already loaded it. If it fails, function will
+        # notify user how to install the pipeline.
         success = True
         try:
-            self.nlp = spacy.load(self.lang + self.suffix)
+            self.load_nlp()
         except:
             # Could not load model
             success = False
@@ -237,65 +692,737 @@ class NER_Core:
             print("python -m spacy download " + self.lang + self.suffix)
         return success
 
+    def load_nlp(self):
+        # Loads the spaCy pipeline, reusing it if another core already loaded it, and disables the components the core
+        # does not need. Raises an error if the pipeline could not be loaded.
+        with self.stage("load"):
+            self.nlp = load_pipeline(self.lang + self.suffix)
+        self.disabled_components = [name for name in self.nlp.pipe_names if name not in self.required_components()]
+
+    def required_components(self):
+        # Returns the pipeline components needed to produce the annotations the core reads. Every part-of-speech is
+        # predicted by the same components, so this does not vary with the desired part-of-speech.
+        if self.entity_mode:
+            return entity_components
+        return pos_components
+
+    def reportDisabledComponents(self):
+        # Prints which of the pipeline's components will not be run.
+        if len(self.disabled_components) > 0:
+            needed_for = "entities" if self.entity_mode else self.desired_POS + " tokens"
+            print("Run info: Disabled spaCy components not needed for " + needed_for + ": "
+                  + ", ".join(self.disabled_components))
+
+    def stage(self, name):
+        # Returns a context manager timing a with block as the given stage if statistics are on, or doing nothing.
+        if self.stats is None:
+            return contextlib.nullcontext()
+        return self.stats.timer(name)
+
+    def process(self, text):
+        # Passes the given text through the NLP model, skipping disabled components.
+        if self.stats is not None:
+            return self.stats.process(self.nlp, text, self.disabled_components)
+        return self.nlp(text, disable=self.disabled_components)
+
+    def pipe_texts(self, texts, as_tuples=False):
+        # Streams the given texts through nlp.pipe() in batches of the set batch size, skipping disabled components.
+        if self.stats is not None:
+            return self.stats.pipe(self.nlp, texts, self.batch_size, self.disabled_components, as_tuples)
+        return self.nlp.pipe(texts, as_tuples=as_tuples, batch_size=self.batch_size, disable=self.disabled_components)
+
     def read_text(self, text):
         # Passes the given text through the NLP model and saves any returned tokens that match the set
-        # desired part-of-speech into the desired tokens set.
-        doc = self.nlp(text)
-        for token in doc:
-            if token.pos_ == self.desired_POS:
-                self.desired_tokens.add(token.text)
+        # desired part-of-speech into the desired tokens set. Text the pre-filter skips is not read.
+        if self.prefilter is not None:
+            text = self.prefilter.filter(text)
+            if text is None:
+                return None
+        doc = self.process(text)
+        self.collect_tokens(doc)
         return doc
 
+    def collect_tokens(self, doc):
+        # Saves any tokens of a processed doc that match the set desired part-of-speech into the desired tokens set,
+        # and into the result cache if one is open. If passages are deduplicated, the doc's passages are remembered
+        # with their tokens.
+        matches = [token for token in doc if token.pos_ == self.desired_POS]
+        tokens = [token.text for token in matches]
+        self.desired_tokens.update(tokens)
+        if self.dedup is not None:
+            self.dedup.record(doc.text, [[token.text, token.idx] for token in matches])
+        if self.stats is not None:
+            self.stats.count("matches", len(tokens))
+        if self.cache is not None:
+            self.cache.store(self.cache_key(doc.text), tokens)
+
     def read_from_file(self):
         # Reads given file, chunk by chunk, and passes chunks through NLP model and save any relevant tokens to
-        # desired set.
-        next_chunk = self.reader.readNextChunk()
-        while next_chunk != "":
-            self.read_text(next_chunk)
-            next_chunk = self.reader.readNextChunk()
+        # desired set. If an index is being built, every token is also filed in the index.
+        if self.entity_mode or self.index is not None or self.columns is not None:
+            offset_chunks = self.reader.offsetChunks()
+            if self.stats is not None:
+                offset_chunks = self.stats.read_chunks(offset_chunks, offsets=True)
+            if self.entity_mode:
+                self.entity_chunks(offset_chunks)
+            else:
+                self.index_chunks(offset_chunks)
+        else:
+            chunks = self.reader.chunks()
+            if self.stats is not None:
+                chunks = self.stats.read_chunks(chunks)
+            if self.auto_lang:
+                self.read_chunks_by_language(chunks)
+            else:
+                self.read_chunks(chunks)
+
+    def begin_document(self, name):
+        # Marks the start of a new document, so index entries and entities record which document they came from.
+        self.document_name = name
+        self.document_chunks = 0
+        if self.index is not None:
+            self.index_document = self.index.add_document(name)
+        if self.columns is not None:
+            self.column_document = self.columns.add_document(name)
+
+    def entity_chunks(self, offset_chunks):
+        # Passes the given [chunk, offset] pairs through the NLP model and writes each named entity span found to the
+        # entity output as a line of JSON, as soon as its chunk is read. Entity offsets are character offsets within
+        # the document, corrected for where each chunk starts, and each entity records the index of its chunk. Entity
+        # texts are also saved to desired set.
+        if self.batch_size > 0:
+            docs = self.pipe_texts(offset_chunks, as_tuples=True)
+        else:
+            docs = ((self.process(chunk), offset) for [chunk, offset] in offset_chunks)
+        for [doc, offset] in docs:
+            chunk_index = self.document_chunks
+            self.document_chunks += 1
+            lines = []
+            for entity in doc.ents:
+                lines.append(json.dumps({"document": self.document_name, "chunk": chunk_index, "text": entity.text,
+                                         "label": entity.label_, "start": offset + entity.start_char,
+                                         "end": offset + entity.end_char}, ensure_ascii=False) + "\n")
+                self.desired_tokens.add(entity.text)
+                if self.columns is not None:
+                    self.columns.add(entity.text, entity.label_, self.column_document, offset + entity.start_char)
+            with self.stage("output"):
+                self.entity_output.write("".join(lines))
+                self.entity_output.flush()
+            if self.stats is not None:
+                self.stats.count("matches", len(lines))
+
+    def index_chunks(self, offset_chunks):
+        # Passes the given [chunk, offset] pairs through the NLP model and files every token, except whitespace, in the
+        # index under its part-of-speech, with its character offset in the document, if an index is being built. Tokens
+        # of the desired part-of-speech are also saved to desired set, and to the column file if one is being written.
+        # The result cache is not used, as it only holds desired tokens.
+        if self.batch_size > 0:
+            docs = self.pipe_texts(offset_chunks, as_tuples=True)
+        else:
+            docs = ((self.process(chunk), offset) for [chunk, offset] in offset_chunks)
+        for [doc, offset] in docs:
+            for token in doc:
+                if self.index is not None and token.pos_ != "SPACE":
+                    self.index.add(token.pos_, token.text, self.index_document, offset + token.idx)
+                if token.pos_ == self.desired_POS:
+                    self.desired_tokens.add(token.text)
+                    if self.columns is not None:
+                        self.columns.add(token.text, token.pos_, self.column_document, offset + token.idx)
+                    if self.stats is not None:
+                        self.stats.count("matches")
+
+    def query_index(self):
+        # Saves the desired part-of-speech's tokens from the saved index or column file to desired set.
+        if NER_Column_Reader.is_column_file(self.query_file):
+            columns = NER_Column_Reader(self.query_file)
+            for [token, count] in columns.pos_counts(self.desired_POS).items():
+                if self.count_tokens:
+                    self.desired_tokens.add(token, count)
+                else:
+                    self.desired_tokens.add(token)
+            columns.close()
+            return
+        index = NER_POS_Index.load(self.query_file)
+        for token in index.tokens(self.desired_POS):
+            if self.count_tokens:
+                self.desired_tokens.add(token, index.count(self.desired_POS, token))
+            else:
+                self.desired_tokens.add(token)
+
+    def read_chunks(self, chunks):
+        # Passes the given chunks through the NLP model and saves any relevant tokens to desired set. If a batch size
+        # is set, chunks are streamed through nlp.pipe() so spaCy can process them in batches, which avoids most of the
+        # per-call overhead of the NLP model. If a result cache is open, chunks it already holds skip the NLP model, and
+        # if a pre-filter is set, chunks it skips are not read at all. If passages are deduplicated, passages already
+        # read are cut out of the chunks and their tokens replayed.
+        if self.prefilter is not None:
+            chunks = self.prefilter.chunks(chunks)
+        if self.dedup is not None:
+            chunks = self.dedup.chunks(chunks, self.lang + self.suffix, self.replay_tokens)
+        if self.cache is not None:
+            chunks = self.uncached_chunks(chunks)
+            if self.stats is not None:
+                chunks = self.stats.timed_iter("cache", chunks)
+        if self.batch_size > 0:
+            for doc in self.pipe_texts(chunks):
+                self.collect_tokens(doc)
+        else:
+            for chunk in chunks:
+                self.collect_tokens(self.process(chunk))
+
+    def read_chunks_by_language(self, chunks):
+        # Detects the language of each of the given chunks and reads it with that language's pipeline. Chunks are
+        # grouped by language, and each group is read once it holds a full batch, so every pipeline is given full
+        # batches however the languages are mixed. Pipelines are loaded on first use and kept in the model cache.
+        group_size = self.batch_size if self.batch_size > 0 else 1
+        groups = {}
+        for chunk in chunks:
+            language = detect_language(chunk)
+            groups.setdefault(language, []).append(chunk)
+            if len(groups[language]) >= group_size:
+                self.read_language_group(language, groups.pop(language))
+        for [language, group] in groups.items():
+            self.read_language_group(language, group)
+
+    def read_language_group(self, language, chunks):
+        # Reads the given chunks, all in the given language, with that language's pipeline. Chunks in a language whose
+        # pipeline could not be loaded are skipped.
+        if language in self.failed_languages:
+            return
+        if self.nlp is None or self.lang != lang_dict[language]:
+            self.lang = lang_dict[language]
+            if not self.initialize_nlp():
+                self.failed_languages.add(language)
+                self.nlp = None
+                return
+        self.language_chunks[language] = self.language_chunks.get(language, 0) + len(chunks)
+        self.read_chunks(chunks)
+
+    def replay_tokens(self, tokens):
+        # Saves the tokens of a passage that was cut out as a duplicate to desired set, as if it had been read.
+        self.desired_tokens.update(tokens)
+        if self.stats is not None:
+            self.stats.count("matches", len(tokens))
+
+    def open_dedup(self):
+        # Creates the deduplication stage, if one was asked for.
+        if self.dedup_unit != "":
+            self.dedup = NER_Dedup(self.dedup_unit, self.dedup_near)
+
+    def close_dedup(self):
+        # Reports how much text deduplication replayed, if any chunks were checked, by this process or by "-j" workers.
+        if self.dedup is not None and self.dedup.passages_seen > 0:
+            self.dedup.report()
+
+    def reportLanguages(self):
+        # Prints how many chunks were read in each detected language.
+        counts = ", ".join(language + ": " + str(count) for [language, count] in sorted(self.language_chunks.items()))
+        print("Run info: Chunks read per detected language: " + (counts if counts != "" else "none"))
+
+    def open_prefilter(self):
+        # Creates the pre-filter for the desired part-of-speech, if one was asked for and any of its checks apply.
+        if not self.prefilter_chunks:
+            return
+        gazetteer = []
+        if self.gazetteer_file != "":
+            with open(self.gazetteer_file, "r", encoding='utf-8') as gazetteer_file:
+                gazetteer = gazetteer_file.read().splitlines()
+        self.prefilter = NER_Prefilter(self.desired_POS, gazetteer)
+        if not self.prefilter.active():
+            print("Run info: No pre-filter checks apply to " + self.desired_POS + " tokens without a gazetteer.")
+            self.prefilter = None
+
+    def close_prefilter(self):
+        # Reports the pre-filter's skip rate, if any chunks were checked, by this process or by "-j" workers.
+        if self.prefilter is not None and self.prefilter.chunks_seen > 0:
+            self.prefilter.report()
+
+    def cache_key(self, text):
+        # Returns the result cache key of the given chunk text for the loaded pipeline and desired part-of-speech.
+        return self.cache.key(self.lang + self.suffix, self.nlp.meta.get("version", ""), self.desired_POS, text)
+
+    def uncached_chunks(self, chunks):
+        # Generator over the given chunks that are not in the result cache. The cached tokens of every other chunk are
+        # saved to desired set directly.
+        for chunk in chunks:
+            tokens = self.cache.lookup(self.cache_key(chunk))
+            if tokens is None:
+                yield chunk
+            else:
+                self.desired_tokens.update(tokens)
+                if self.dedup is not None:
+                    # Its passages' own tokens are unknown, so they are not remembered
+                    self.dedup.forget(chunk)
+
+    def open_cache(self):
+        # Opens the result cache file, if one was set.
+        if self.cache_file != "":
+            self.cache = NER_Result_Cache(self.cache_file, self.cache_size_limit)
+
+    def close_cache(self):
+        # Reports the result cache's hit rate and closes it, if one is open, or reports the hit rate of the "-j"
+        # workers' result caches.
+        if self.cache is not None:
+            print("Run info: Result cache hits: %d, misses: %d" % (self.cache.hits, self.cache.misses))
+            self.cache.close()
+            self.cache = None
+        elif self.shard_cache_counts is not None:
+            print("Run info: Result cache hits: %d, misses: %d" % tuple(self.shard_cache_counts))
+
+    def set_chunk_size(self, size):
+        # Sets the reader's chunk size from a string in "-s" format. Returns a boolean indicating whether the size could
+        # be interpreted.
+        units = {"s": "sentences", "t": "tokens"}
+        if len(size) > 1 and size[-1] in units and size[:-1].isdigit() and int(size[:-1]) > 0:
+            # Chunk toward a target, joining pieces of the target piece size
+            self.reader.chunk_size_limit = target_piece_size
+            self.reader.chunk_target = int(size[:-1])
+            self.reader.chunk_target_unit = units[size[-1]]
+        elif size.isdigit() and int(size) > 0:
+            # Chunk up to a size limit
+            self.reader.chunk_size_limit = int(size)
+            self.reader.chunk_target = 0
+        else:
+            return False
+        return True
+
+    def calibrate_chunk_size(self, sample_text, sizes=calibration_sizes, repeats=2):
+        # Times reading the sample text at each of the given chunk sizes, with the loaded pipeline and current batch
+        # settings, then sets the reader to the fastest size. The first size is read once beforehand to warm up the
+        # pipeline, and each size keeps its best time of the given number of repeats. Returns a list of [size, seconds]
+        # pairs, fastest first. Tokens and entities found while calibrating are discarded, and the result cache,
+        # pre-filter, deduplication, statistics, index and column file are not used.
+        saved_reader = self.reader
+        saved_tokens = self.desired_tokens
+        saved_cache = self.cache
+        self.cache = None  # Cache hits would hide the cost of each size
+        saved_prefilter = self.prefilter
+        self.prefilter = None  # The sample's chunks would be counted in the run's skip rate
+        saved_dedup = self.dedup
+        self.dedup = None  # Replayed passages would hide the cost of each size, and the sample's would be remembered
+        saved_stats = self.stats
+        self.stats = None  # Likewise for the run's statistics
+        saved_index = self.index
+        self.index = None  # The index may already be open, ex. with "-web", and only holds the run's text
+        saved_columns = self.columns
+        self.columns = None  # Likewise for the column file
+        saved_entity_output = self.entity_output
+        if self.entity_mode:
+            # Calibration can run before the entity output is opened, and its entities are not part of the output
+            self.entity_output = open(os.devnull, "w", encoding='utf-8')
+        timings = []
+        for size in [sizes[0]] + list(sizes):
+            self.reader = type(saved_reader)(size_limit=saved_reader.chunk_size_limit)
+            self.set_chunk_size(size)
+            best_time = None
+            for _ in range(repeats):
+                self.desired_tokens = sortedcontainers.SortedSet()
+                self.reader.open_text(sample_text)
+                t_start = time.perf_counter()
+                self.read_from_file()
+                elapsed = time.perf_counter() - t_start
+                best_time = elapsed if best_time is None else min(best_time, elapsed)
+            timings.append([size, best_time])
+        timings = sorted(timings[1:], key=lambda timing: timing[1])
+        self.reader = saved_reader
+        self.desired_tokens = saved_tokens
+        self.cache = saved_cache
+        self.prefilter = saved_prefilter
+        self.dedup = saved_dedup
+        self.stats = saved_stats
+        self.index = saved_index
+        self.columns = saved_columns
+        if self.entity_mode:
+            self.entity_output.close()
+        self.entity_output = saved_entity_output
+        self.set_chunk_size(timings[0][0])
+        return timings
+
+    def calibrate_from_file(self, file_name):
+        # Calibrates the chunk size using the start of the given file as the sample, and reports the timings.
+        with open(file_name, "r", encoding='utf-8') as sample_file:
+            sample_text = sample_file.read(calibration_sample_size)
+        print("---------- Chunk Size Calibration ----------")
+        timings = self.calibrate_chunk_size(sample_text)
+        for [size, seconds] in timings:
+            print("%8s: %.3f seconds" % (size, seconds))
+        print("Run info: Reading with fastest chunk size, " + timings[0][0] + ".")
+
+    def read_from_urls(self, urls):
+        # Scrapes the given websites concurrently and passes each website's text through the NLP model as soon as it
+        # arrives, while the remaining websites download. If a save directory is set, each website's text is also saved
+        # into it, named by a hash of its URL.
+        fetcher = NER_Web_Fetcher()
+        texts = fetcher.texts(urls)
+        if self.stats is not None:
+            texts = self.stats.timed_iter("webscrape", texts)
+        for [url, text, error] in texts:
+            if text is None:
+                print("Run warning: Failed to scrape \"" + url + "\": " + error)
+                continue
+            if self.url_save_dir != "":
+                save_name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + ".txt"
+                with open(os.path.join(self.url_save_dir, save_name), "w", encoding='utf-8') as save_file:
+                    save_file.write(text)
+            self.reader.open_text(text)
+            self.begin_document(url)
+            self.read_from_file()
+            self.reader.close()
+        fetcher.close()
+
+    def read_url_list(self):
+        # Returns the websites listed in the URL list file, skipping blank lines and "#" comments.
+        with open(self.url_list, "r", encoding='utf-8') as url_file:
+            lines = [line.strip() for line in url_file]
+        return [line for line in lines if line != "" and line[0] != '#']
+
+    def resolve_read_files(self):
+        # Expands the read file argument into a list of files. A directory is expanded into the files directly inside
+        # it and a wildcard pattern (ex. "corpus/**/*.txt") into every file that matches it, both in sorted order.
+        if os.path.isdir(self.read_file):
+            file_names = [os.path.join(self.read_file, name) for name in sorted(os.listdir(self.read_file))]
+            return [name for name in file_names if os.path.isfile(name)]
+        if any(character in self.read_file for character in "*?["):
+            return [name for name in sorted(glob.glob(self.read_file, recursive=True)) if os.path.isfile(name)]
+        return [self.read_file]
+
+    def load_checkpoints(self):
+        # Returns the reading checkpoint of each file recorded in the checkpoint file, keyed by absolute file name.
+        if self.checkpoint_file == "" or not os.path.exists(self.checkpoint_file):
+            return {}
+        with open(self.checkpoint_file, "r", encoding='utf-8') as checkpoint_file:
+            return json.load(checkpoint_file)["files"]
+
+    def save_checkpoints(self, checkpoints):
+        # Records the given reading checkpoints in the checkpoint file, replacing it in one step so an interrupted save
+        # never leaves a partial file.
+        if self.checkpoint_file == "":
+            return
+        temporary_file = self.checkpoint_file + ".tmp"
+        with open(temporary_file, "w", encoding='utf-8') as checkpoint_file:
+            json.dump({"files": checkpoints}, checkpoint_file, ensure_ascii=False)
+        os.replace(temporary_file, self.checkpoint_file)
+
+    def read_appended(self, checkpoints):
+        # Reads the text appended to each "-f" file since its checkpoint, or all of a file that has no checkpoint, and
+        # updates the checkpoints. A file that was replaced or truncated since its checkpoint is read from the start,
+        # and the text held back at the end of a file left unchanged for a while is read, as no sentence end may ever
+        # follow it. Entity chunks are numbered on from the checkpoint. Returns whether any text was read.
+        appended = False
+        for file_name in self.resolve_read_files():
+            if not os.path.isfile(file_name):
+                continue
+            key = os.path.abspath(file_name)
+            status = os.stat(file_name)
+            checkpoint = checkpoints.get(key)
+            if checkpoint is not None and (checkpoint["inode"] != status.st_ino
+                                           or checkpoint["offset"] > status.st_size):
+                checkpoint = None
+            hold_back = True
+            if checkpoint is not None and checkpoint["offset"] == status.st_size:
+                if checkpoint["carry_over"] == "" or time.time() - status.st_mtime < held_text_timeout:
+                    continue
+                # Nothing was appended for a while, so the held back text is read as it is
+                hold_back = False
+            appended = True
+            self.reader.open_appended(file_name, checkpoint, hold_back)
+            self.begin_document(file_name)
+            if checkpoint is not None:
+                self.document_chunks = checkpoint.get("chunks", 0)
+            self.read_from_file()
+            checkpoints[key] = dict(self.reader.checkpoint(), inode=status.st_ino, chunks=self.document_chunks)
+            self.reader.close()
+        return appended
+
+    def follow_files(self):
+        # Reads text appended to the "-f" files since the last checkpoint, then, if following, keeps checking for more
+        # until interrupted. The tokens found in each round of appended text are output and the checkpoints are saved
+        # before the next round.
+        checkpoints = self.load_checkpoints()
+        try:
+            while True:
+                if self.read_appended(checkpoints):
+                    if not self.entity_mode:
+                        self.printDesiredTokens()
+                    self.desired_tokens.clear()
+                self.save_checkpoints(checkpoints)
+                if not self.follow:
+                    break
+                time.sleep(self.follow_interval)
+        except KeyboardInterrupt:
+            self.save_checkpoints(checkpoints)
+
+    def shards(self, file_names):
+        # Generator that reads the given files with the article reader, so chunks keep its sentence cropping behavior,
+        # and groups their chunks into shards to hand off to worker processes.
+        shard = []
+        for file_name in file_names:
+            self.reader.open_file(file_name)
+            for chunk in self.reader.chunks():
+                shard.append(chunk)
+                if len(shard) == shard_size:
+                    yield shard
+                    shard = []
+            self.reader.close()
+        if len(shard) > 0:
+            yield shard
+
+    def apply_cpu_settings(self):
+        # Uses the transformer batch size for transformer pipelines, limits the NLP model's threads, and pins this
+        # process to its cores, if set. When reading in worker processes, each worker pins itself to its share instead.
+        if self.suffix == "_trf" and self.transformer_batch_size > 0:
+            self.batch_size = self.transformer_batch_size
+        if self.threads > 0:
+            limit_threads(self.threads)
+        if len(self.pin_cores) > 0 and self.workers == 1:
+            pin_to_cores(self.pin_cores)
+
+    def worker_core_shares(self):
+        # Returns a queue holding each worker's share of the pinned cores, dealt out in turn, or None if not pinning.
+        if len(self.pin_cores) == 0:
+            return None
+        shares = multiprocessing.Queue()
+        for worker in range(self.workers):
+            shares.put(self.pin_cores[worker % len(self.pin_cores)::self.workers] or self.pin_cores)
+        return shares
+
+    def read_files_parallel(self, file_names):
+        # Reads the given files across a pool of worker processes. Each worker loads the spaCy pipeline once, reads
+        # the shards it is handed and returns its matching tokens, which are merged into the desired tokens set. At
+        # most two shards per worker are in flight at once, to bound memory use on large corpora. Returns a boolean
+        # indicating whether every worker could initialize its pipeline.
+        settings = (self.lang + self.suffix, self.desired_POS, self.batch_size, self.cache_file, self.cache_size_limit,
+                    self.count_tokens, self.prefilter, self.dedup, self.threads, self.worker_core_shares())
+        success = True
+        with concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_shard_worker,
+                                                    initargs=settings) as pool:
+            # Every worker disables the same components, so any one of them can report them.
+            self.disabled_components = pool.submit(_shard_disabled_components).result()
+            if self.disabled_components is None:
+                return False
+            self.reportDisabledComponents()
+            pending = set()
+            for shard in self.shards(file_names):
+                pending.add(pool.submit(_read_shard, shard))
+                if len(pending) >= 2 * self.workers:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    success = self.merge_shard_results(done) and success
+                if not success:
+                    break
+            success = self.merge_shard_results(concurrent.futures.as_completed(pending)) and success
+        return success
+
+    def merge_shard_results(self, futures):
+        # Merges the tokens returned by finished shard futures into the desired tokens set, and adds the result cache,
+        # pre-filter and deduplication counts returned with them to this process's, so they are reported once. Returns False if a
+        # worker could not initialize its pipeline.
+        success = True
+        for future in futures:
+            result = future.result()
+            if result is None:
+                success = False
+                continue
+            [tokens, counts] = result
+            if self.prefilter is not None:
+                self.prefilter.add_counts(counts["prefilter"])
+            if self.dedup is not None:
+                self.dedup.add_counts(counts["dedup"])
+            if counts["cache"] is not None:
+                self.shard_cache_counts = [total + count for [total, count] in
+                                           zip(self.shard_cache_counts or [0, 0], counts["cache"])]
+            if self.count_tokens:
+                # Workers return [token, count] pairs
+                for [token, count] in tokens:
+                    self.desired_tokens.add(token, count)
+            else:
+                self.desired_tokens.update(tokens)
+        return success
 
     def echo_to_file(self):
-        save_file = open(self.save_file, "w")
-        for token in self.desired_tokens:
-            save_file.write(token + "\n")
-        save_file.close()
+        # Writes each entry in the desired tokens set to the save file, followed by a tab and its count if tokens are
+        # counted.
+        with open(self.save_file, self.save_mode, encoding='utf-8') as save_file:
+            save_file.writelines(line + "\n" for line in self.output_lines())
+
+    def output_lines(self):
+        # Generator over the output line of each entry in the desired tokens set.
+        if self.count_tokens:
+            for [token, count] in self.desired_tokens.items():
+                yield token + "\t" + str(count)
+        else:
+            yield from self.desired_tokens
 
     def printDesiredTokens(self):
         # Prints each entry in the desired tokens set in the console.
-        print("---------- " + self.desired_POS + " Tokens Found in Text ----------")
-        for token in self.desired_tokens:
-            print(token)
+        with self.stage("output"):
+            print("---------- " + self.desired_POS + " Tokens Found in Text ----------")
+            for line in self.output_lines():
+                print(line)
 
-        if self.save_file != "":
-            # Save file specified as well, echo
-            self.echo_to_file()
+            if self.save_file != "":
+                # Save file specified as well, echo
+                self.echo_to_file()
 
     def run(self):
+        # Runs the settings established during parsing, profiling the run if a profile file was set and reporting
+        # statistics afterwards if they were turned on.
+        if self.profile_file != "":
+            profiler = cProfile.Profile()
+            result = profiler.runcall(self.run_stages)
+            profiler.dump_stats(self.profile_file)
+            print("Run info: Saved profile to \"" + self.profile_file + "\".", file=sys.stderr)
+        else:
+            result = self.run_stages()
+        if self.stats is not None:
+            self.stats.finish()
+            self.stats.report()
+        return result
+
+    def run_stages(self):
         # Comprehensive run operation. Will adjust inputs to NLP based on settings established during parsing, ex. if
         # a file was set to read, the article handler will feed text from file into NLP; if just text was given, it will
         # be directly given to the NLP; etc.
-        initialized = self.initialize_nlp()
-        if not initialized:
-            # Couldn't initialize pipeline
+        if self.query_file != "":
+            # Tokens from a saved index, no text is read
+            self.query_index()
+            self.printDesiredTokens()
+            return self.desired_tokens
+        if self.read_file == "" and self.url_list == "" and self.text_arg == "":
+            # No text to read
+            print("Run error: No text was specified.")
+            return []
+        if self.entity_mode and self.index_file != "":
+            # Entity spans are not part-of-speech tokens
+            print("Run error: \"-e\" cannot be combined with \"-index\".")
+            return []
+        if (self.follow or self.checkpoint_file != "") and (self.read_file == "" or self.website != "" or
+                                                          self.index_file != "" or self.column_file != "" or
+                                                          isinstance(self.reader, NER_Mapped_Reader)):
+            # Appended text is only tracked in plain files
+            print("Run error: \"-follow\" and \"-checkpoint\" need \"-f\", and cannot be combined with \"-web\", "
+                  "\"-index\", \"-columns\" or \"-m\".")
+            return []
+        if self.auto_lang and (self.entity_mode or self.index_file != "" or self.column_file != "" or self.calibrate):
+            # These read every chunk with a single pipeline
+            print("Run error: \"-l auto\" cannot be combined with \"-e\", \"-index\", \"-columns\" or \"-calibrate\".")
+            return []
+        if self.dedup_unit != "" and (self.entity_mode or self.index_file != "" or self.column_file != ""):
+            # These locate every match in the text, so no passage can be cut out
+            print("Run error: \"-dedup\" cannot be combined with \"-e\", \"-index\" or \"-columns\".")
             return []
+        if self.prefilter_chunks and (self.entity_mode or self.index_file != "" or self.column_file != ""):
+            # These read every chunk to locate its matches, so none can be skipped
+            print("Run error: \"-prefilter\" cannot be combined with \"-e\", \"-index\" or \"-columns\".")
+            return []
+        self.open_prefilter()
+        self.open_dedup()
+        self.apply_cpu_settings()
+        if self.read_file != "" and self.website == "":
+            # Files are expanded up front, as a directory or wildcard pattern can name many files.
+            file_names = self.resolve_read_files()
+            if len(file_names) == 0 and not self.follow:
+                print("Run error: No files matched \"" + self.read_file + "\".")
+                return []
+            if self.calibrate and len(file_names) > 0:
+                # Calibration needs the pipeline loaded in this process, even if reading happens in workers
+                if not self.initialize_nlp():
+                    return []
+                self.calibrate_from_file(file_names[0])
+            if (self.workers > 1 and self.index_file == "" and self.column_file == "" and not self.entity_mode
+                    and not self.auto_lang and not self.follow and self.checkpoint_file == ""):
+                # Parallel reading, each worker process loads its own pipeline
+                if not self.read_files_parallel(file_names):
+                    return []
+                self.close_cache()
+                self.close_prefilter()
+                self.close_dedup()
+                self.printDesiredTokens()
+                return self.desired_tokens
+        if not self.auto_lang:
+            # Detected languages load their pipelines as they are first seen
+            initialized = self.initialize_nlp()
+            if not initialized:
+                # Couldn't initialize pipeline
+                return []
+            self.reportDisabledComponents()
+        self.open_cache()
+        if self.index_file != "":
+            self.index = NER_POS_Index()
+            self.index.model_name = self.lang + self.suffix
+        if self.column_file != "":
+            self.columns = NER_Column_Writer(self.column_file, self.lang + self.suffix)
+        if self.follow or self.checkpoint_file != "":
+            # Each run, and each round, only outputs what was found in the appended text
+            self.save_mode = "a"
+        if self.entity_mode:
+            # Entities are streamed to the save file if one was set, otherwise to the console
+            self.entity_output = (open(self.save_file, self.save_mode, encoding='utf-8') if self.save_file != ""
+                                  else sys.stdout)
         # Reading text
         if self.read_file != "":
             # File and website behavior
             if self.website != "":
                 # Website specified
-                self.reader.webscape(self.website, self.read_file)
+                if self.calibrate:
+                    # Calibration needs the whole text before reading, so the page is saved first
+                    with self.stage("webscrape"):
+                        self.reader.webscape(self.website, self.read_file)
+                    self.calibrate_from_file(self.read_file)
+                else:
+                    # The page's text is chunked as it downloads, and saved as it is read
+                    with self.stage("webscrape"):
+                        self.reader.open_url(self.website, self.read_file)
+                self.begin_document(self.website)
+                self.read_from_file()
+                self.reader.close()
+            elif self.follow or self.checkpoint_file != "":
+                # Appended text of file(s) specified, output in rounds as it is read
+                self.follow_files()
             else:
-                # File specified
-                self.reader.open_file(self.read_file)
+                # File(s) specified
+                for file_name in file_names:
+                    self.reader.open_file(file_name)
+                    self.begin_document(file_name)
+                    self.read_from_file()
+                    self.reader.close()
+        elif self.url_list != "":
+            # Websites from list
+            if self.url_save_dir != "":
+                os.makedirs(self.url_save_dir, exist_ok=True)
+            self.read_from_urls(self.read_url_list())
+        elif (self.index is not None or self.columns is not None or self.entity_mode or self.auto_lang
+              or self.dedup is not None):
+            # Text from argument, read like a file so it is indexed, its matches are located, its entities are streamed,
+            # its language detected or its passages deduplicated
+            self.reader.open_text(self.text_arg)
+            self.begin_document("text")
             self.read_from_file()
             self.reader.close()
-        elif self.text_arg != "":
+        else:
             # Text from argument
             self.read_text(self.text_arg)
-        else:
-            # No text to read
-            print("Run error: No text was specified.")
-            return []
+        self.close_cache()
+        self.close_prefilter()
+        self.close_dedup()
+        if self.auto_lang:
+            self.reportLanguages()
+        if self.index is not None:
+            self.index.save(self.index_file)
+            print("Run info: Saved part-of-speech index to \"" + self.index_file + "\".")
+            self.index = None
+        if self.columns is not None:
+            self.columns.close()
+            print("Run info: Saved matches to column file \"" + self.column_file + "\".")
+            self.columns = None
+        if self.entity_mode:
+            # Entities were already output while reading
+            if self.entity_output is not sys.stdout:
+                self.entity_output.close()
+            self.entity_output = None
+            return self.desired_tokens
+        if self.follow or self.checkpoint_file != "":
+            # Tokens were already output after each round of appended text
+            return self.desired_tokens
 
         # Output
         self.printDesiredTokens()
@@ -317,7 +1444,7 @@ class NER_Core:
                     input_ok = False
             else:
                 # Text argument
-                if self.read_file == "":
+                if self.read_file == "" and self.url_list == "":
                     # No read file or website has been specified, accept text argument
                     self.text_arg = arguments[0]
                     if len(arguments) > 1:
@@ -329,3 +1456,66 @@ class NER_Core:
                 arguments = []
 
         return input_ok
+
+
+# ---------------------------------- Shard Worker Functions ----------------------------------
+# Used by NER_Core.read_files_parallel(). These live at module level so worker processes can find them, and each worker
+# keeps its own core, and thus its own loaded pipeline, between shards.
+
+_shard_core = None
+
+
+def _init_shard_worker(model_name, desired_POS, batch_size, cache_file, cache_size_limit, count_tokens, prefilter,
+                       dedup, threads, core_shares):
+    # Worker process initializer. Pins the worker to its share of the cores and limits its threads, if set, then loads
+    # the spaCy pipeline, and opens the result cache if one was set, once for the lifetime of the worker.
+    global _shard_core
+    if threads > 0:
+        limit_threads(threads)
+    if core_shares is not None:
+        try:
+            pin_to_cores(core_shares.get(timeout=1))
+        except queue.Empty:
+            # A replacement for a worker that exited; its share was already taken
+            pass
+    core = NER_Core()
+    core.count_tokens = count_tokens
+    core.prefilter = prefilter
+    core.dedup = dedup
+    if count_tokens:
+        core.desired_tokens = NER_Spill_Set()
+    core.lang = model_name
+    core.suffix = ""
+    core.desired_POS = desired_POS
+    core.batch_size = batch_size
+    core.cache_file = cache_file
+    core.cache_size_limit = cache_size_limit
+    if core.initialize_nlp():
+        core.open_cache()
+        _shard_core = core
+
+
+def _shard_disabled_components():
+    # Returns the pipeline components the worker disabled, or None if the worker could not load its pipeline.
+    if _shard_core is None:
+        return None
+    return _shard_core.disabled_components
+
+
+def _read_shard(chunks):
+    # Passes a shard of chunks through the worker's pipeline and returns a [tokens, counts] pair, or None if the worker
+    # could not load its pipeline. Tokens are the matching tokens, as [token, count] pairs if tokens are counted, and
+    # counts hold the shard's result cache, pre-filter and deduplication counts, for the main process to report.
+    if _shard_core is None:
+        return None
+    _shard_core.desired_tokens.clear()
+    _shard_core.read_chunks(chunks)
+    if _shard_core.cache is not None:
+        # Workers are never told when they stop, so results are committed with every shard.
+        _shard_core.cache.connection.commit()
+    counts = {"cache": _shard_core.cache.take_counts() if _shard_core.cache is not None else None,
+              "prefilter": _shard_core.prefilter.take_counts() if _shard_core.prefilter is not None else None,
+              "dedup": _shard_core.dedup.take_counts() if _shard_core.dedup is not None else None}
+    if _shard_core.count_tokens:
+        return [list(_shard_core.desired_tokens.items()), counts]
+    return [list(_shard_core.desired_tokens), counts]
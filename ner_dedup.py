@@ -0,0 +1,179 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Deduplication stage run on each chunk between the article reader and the NLP model. Chunks are split into passages,
+# paragraphs or sentences, and each passage is hashed with its whitespace collapsed. A passage already read by the
+# model is cut out of the chunk, and the desired tokens found in it the first time are replayed instead, so repeated
+# headers, footers, license boilerplate and syndicated articles are only read once, while every copy still counts
+# towards the tokens found. Optionally, MinHash signatures catch near-duplicate passages as well.
+import re  # Used to split chunks into passages
+import random  # Used to draw the MinHash permutations
+import hashlib  # Used to hash passages and shingles
+import collections  # Used to evict the least recently seen passages
+
+dedup_entries = 65536  # Most passages remembered at once; the least recently seen are forgotten first
+dedup_min_length = 64  # Characters a passage needs to be deduplicated; shorter passages are always read
+minhash_permutations = 64  # Hash functions in a MinHash signature
+minhash_bands = 16  # Bands of the signature; passages sharing any band are compared
+minhash_shingle = 3  # Words per shingle
+minhash_threshold = 0.8  # Estimated similarity a passage needs to be treated as a near-duplicate
+minhash_prime = (1 << 61) - 1
+
+# Separators passages are split at, kept with the passage before them
+passage_patterns = {
+    "paragraphs": re.compile(r"(\n[ \t\r\f\v]*\n\s*)"),
+    "sentences": re.compile(r"(?<=[.?!])(\s+)")
+}
+
+
+class NER_Dedup:
+    # Remembers the desired tokens found in up to the given number of passages. Passages are only remembered once the
+    # model has read them, so a copy that arrives while its first copy is still waiting in a batch is read again.
+    # Counts how many passages and characters were replayed rather than read.
+
+    def __init__(self, unit="paragraphs", near=False, entries=dedup_entries):
+        self.pattern = passage_patterns[unit]
+        self.unit = unit
+        self.near = near
+        self.entries = entries
+        self.tokens = collections.OrderedDict()  # Passage key -> desired tokens found in it, least recently seen first
+        self.pending = {}  # Chunk text sent to the model -> list of [start, end, key] spans of the passages in it
+        self.signatures = {}  # Passage key -> MinHash signature, for near-duplicate detection
+        self.buckets = {}  # [band, band hash] -> passage key, for near-duplicate detection
+        random_state = random.Random(minhash_permutations)
+        self.permutations = [[random_state.randrange(1, minhash_prime), random_state.randrange(0, minhash_prime)]
+                             for _ in range(minhash_permutations)]
+        self.passages_seen = 0
+        self.passages_replayed = 0
+        self.characters_seen = 0
+        self.characters_replayed = 0
+
+    def key(self, model_name, passage):
+        # Returns the key of the given passage read by the given pipeline, ignoring differences in whitespace.
+        normalized = model_name + "\0" + " ".join(passage.split())
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+    def signature(self, passage):
+        # Returns the MinHash signature of the given passage's word shingles.
+        words = passage.lower().split()
+        shingles = {" ".join(words[index:index + minhash_shingle])
+                    for index in range(max(1, len(words) - minhash_shingle + 1))}
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), "little")
+                  for shingle in shingles]
+        return tuple(min((a * value + b) % minhash_prime for value in hashes) for [a, b] in self.permutations)
+
+    def band_keys(self, signature):
+        rows = minhash_permutations // minhash_bands
+        return [(band, hash(signature[band * rows:(band + 1) * rows])) for band in range(minhash_bands)]
+
+    def near_duplicate(self, signature):
+        # Returns the key of a remembered passage whose estimated similarity to the given signature passes the
+        # threshold, or None.
+        for band_key in self.band_keys(signature):
+            key = self.buckets.get(band_key)
+            if key is None or key not in self.signatures:
+                continue
+            matches = sum(1 for [mine, theirs] in zip(signature, self.signatures[key]) if mine == theirs)
+            if matches >= minhash_threshold * minhash_permutations:
+                return key
+        return None
+
+    def chunks(self, chunks, model_name, replay):
+        # Generator over the given chunks with every remembered passage cut out. The desired tokens of each passage cut
+        # out are passed to replay(), and chunks left with no passages are not yielded at all.
+        for chunk in chunks:
+            parts = self.pattern.split(chunk)
+            kept = []
+            spans = []
+            position = 0
+            for index in range(0, len(parts), 2):
+                passage = parts[index]
+                separator = parts[index + 1] if index + 1 < len(parts) else ""
+                self.passages_seen += 1
+                self.characters_seen += len(passage) + len(separator)
+                if len(passage.strip()) < dedup_min_length:
+                    # Too short to be worth remembering, ex. a heading
+                    kept.append(passage + separator)
+                    position += len(passage) + len(separator)
+                    continue
+                key = self.key(model_name, passage)
+                if key not in self.tokens and self.near:
+                    signature = self.signature(passage)
+                    key = self.near_duplicate(signature) or key
+                    self.signatures.setdefault(key, signature)
+                if key in self.tokens:
+                    self.tokens.move_to_end(key)
+                    self.passages_replayed += 1
+                    self.characters_replayed += len(passage) + len(separator)
+                    replay(self.tokens[key])
+                    continue
+                spans.append([position, position + len(passage), key])
+                kept.append(passage + separator)
+                position += len(passage) + len(separator)
+            text = "".join(kept)
+            if text.strip() == "":
+                continue
+            self.pending.setdefault(text, []).append(spans)
+            yield text
+
+    def record(self, text, tokens):
+        # Remembers the desired tokens found in each passage of a chunk yielded by chunks() once the model has read
+        # it. Tokens are given as [text, character offset] pairs within the chunk.
+        spans_list = self.pending.get(text)
+        if spans_list is None:
+            return
+        spans = spans_list.pop(0)
+        if len(spans_list) == 0:
+            del self.pending[text]
+        for [start, end, key] in spans:
+            self.remember(key, [token for [token, offset] in tokens if start <= offset < end])
+
+    def forget(self, text):
+        # Drops a chunk yielded by chunks() that will not be read by the model, so its passages are not remembered.
+        spans_list = self.pending.get(text)
+        if spans_list is not None:
+            spans_list.pop(0)
+            if len(spans_list) == 0:
+                del self.pending[text]
+
+    def remember(self, key, tokens):
+        # Remembers a passage's desired tokens, forgetting the least recently seen passage if over the limit.
+        self.tokens[key] = tokens
+        self.tokens.move_to_end(key)
+        if self.near and key in self.signatures:
+            for band_key in self.band_keys(self.signatures[key]):
+                self.buckets[band_key] = key
+        while len(self.tokens) > self.entries:
+            [forgotten, _] = self.tokens.popitem(last=False)
+            signature = self.signatures.pop(forgotten, None)
+            if signature is not None:
+                for band_key in self.band_keys(signature):
+                    if self.buckets.get(band_key) == forgotten:
+                        del self.buckets[band_key]
+        if self.near and len(self.signatures) > 2 * self.entries:
+            # Signatures of passages never remembered, ex. cut off by the end of the input, are dropped
+            self.signatures = {key: self.signatures[key] for key in self.signatures if key in self.tokens}
+
+    def take_counts(self):
+        # Returns the [passages seen, passages replayed, characters seen, characters replayed] counts since they were
+        # last taken, and resets them. Used to return a worker process's counts to the main process.
+        counts = [self.passages_seen, self.passages_replayed, self.characters_seen, self.characters_replayed]
+        self.passages_seen = self.passages_replayed = self.characters_seen = self.characters_replayed = 0
+        return counts
+
+    def add_counts(self, counts):
+        # Adds counts returned by take_counts(), ex. from a worker process.
+        self.passages_seen += counts[0]
+        self.passages_replayed += counts[1]
+        self.characters_seen += counts[2]
+        self.characters_replayed += counts[3]
+
+    def replay_rate(self):
+        # Returns the fraction of characters replayed rather than read.
+        return self.characters_replayed / self.characters_seen if self.characters_seen > 0 else 0.0
+
+    def report(self):
+        # Prints how many passages and characters were replayed rather than read by the model.
+        print("Run info: Dedup replayed %d of %d %s (%.1f%%) and %d of %d characters (%.1f%%)" %
+              (self.passages_replayed, self.passages_seen, self.unit, 100 * self.passages_replayed /
+               max(self.passages_seen, 1), self.characters_replayed, self.characters_seen, 100 * self.replay_rate()))
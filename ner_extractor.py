@@ -0,0 +1,130 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Library interface to Grier-NER, for programs that embed it rather than starting ner_fuhrer.py. An NER_Extractor is
+# configured once, loading its spaCy pipeline, and then reads any number of documents without printing anything.
+# Documents may be strings of text, paths to files, or open text file objects, and an iterable of them is read lazily:
+# the chunks of consecutive documents are batched together through nlp.pipe(), and each document's result is yielded
+# as soon as its last chunk is read.
+#
+# Example:
+#   with NER_Extractor(lang="en", pos="propn") as extractor:
+#       tokens = extractor.extract("Abraham Lincoln wrote to Washington.")
+#       for tokens in extractor.extract_all(pathlib.Path("corpus").glob("*.txt")):
+#           ...
+import os  # Used to tell file paths from text
+import sortedcontainers  # Used to organize each document's tokens
+from ner_core import NER_Core, lang_dict, pos_dict
+
+extractor_batch_size = 64  # Default chunks per nlp.pipe() batch
+
+
+class NER_Extractor:
+    # Reads documents with one loaded pipeline. Strings are always read as text; pass file paths as os.PathLike
+    # objects, ex. pathlib.Path, to read files. File objects are read but left open. Each document's result depends on
+    # the settings: by default, the sorted unique tokens of the desired part-of-speech; with counts, [token, count]
+    # pairs sorted by token; with entities, the named entity spans found, each a dictionary of its text, label and
+    # character offsets in the document. Settings take the same values as the console flags ("-l", "-p", "-a", "-b",
+    # "-s"). Raises ValueError for settings that cannot be interpreted, and OSError if the pipeline is not installed.
+
+    def __init__(self, lang="en", pos="propn", accurate=False, batch_size=extractor_batch_size, size="8184",
+                 entities=False, counts=False):
+        if lang.lower() not in lang_dict:
+            raise ValueError("Language \"" + lang + "\" was not recognized.")
+        if pos.lower() not in pos_dict:
+            raise ValueError("Part-of-speech \"" + pos + "\" was not recognized.")
+        if entities and counts:
+            raise ValueError("Entities cannot be counted.")
+        self.core = NER_Core()
+        self.core.lang = lang_dict[lang.lower()]
+        self.core.suffix = "_trf" if accurate else "_sm"
+        self.core.desired_POS = pos_dict[pos.lower()]
+        self.core.batch_size = batch_size
+        self.core.entity_mode = entities
+        self.counts = counts
+        if not self.core.set_chunk_size(str(size)):
+            raise ValueError("Chunk size \"" + str(size) + "\" was not recognized.")
+        self.core.load_nlp()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # Releases the pipeline. It stays in the process-wide model cache for other cores until evicted.
+        self.core.nlp = None
+
+    def extract(self, document):
+        # Reads a single document and returns its result.
+        return next(self.extract_all([document]))
+
+    def extract_all(self, documents):
+        # Generator over the results of the given documents, in order. Documents are opened one at a time as their
+        # chunks are needed, and files opened from paths are closed once read.
+        results = None
+        for [doc, [index, offset]] in self.docs(documents):
+            if offset is None:
+                # The document's end marker; every one of its chunks has been read
+                yield self.result(results)
+                results = None
+                continue
+            if results is None:
+                results = [] if self.core.entity_mode else {}
+            self.collect(results, doc, offset)
+
+    def docs(self, documents):
+        # Generator over [doc, [document index, chunk offset]] pairs of every chunk of the given documents, read through
+        # the pipeline. Each document's chunks are followed by an empty end marker with no offset.
+        chunks = self.chunks(documents)
+        if self.core.batch_size > 0:
+            return self.core.pipe_texts(chunks, as_tuples=True)
+        return ([self.core.process(chunk), context] for [chunk, context] in chunks)
+
+    def chunks(self, documents):
+        # Generator over [chunk, [document index, chunk offset]] pairs of the given documents, each document's followed
+        # by its end marker.
+        for [index, document] in enumerate(documents):
+            opened = self.open(document)
+            try:
+                for [chunk, offset] in self.core.reader.offsetChunks():
+                    yield [chunk, [index, offset]]
+            finally:
+                if opened:
+                    self.core.reader.close()
+            yield ["", [index, None]]
+
+    def open(self, document):
+        # Opens the given document in the core's reader. Returns whether a file was opened that must be closed.
+        reader = self.core.reader
+        if isinstance(document, str):
+            reader.open_text(document)
+            return False
+        if isinstance(document, os.PathLike):
+            reader.open_file(os.fspath(document))
+            return True
+        if hasattr(document, "read"):
+            reader.open_stream(document)
+            return False
+        raise TypeError("Documents must be text, a file path or a text file object, not " + type(document).__name__)
+
+    def collect(self, results, doc, offset):
+        # Adds the matches of one chunk's doc to its document's results.
+        if self.core.entity_mode:
+            for entity in doc.ents:
+                results.append({"text": entity.text, "label": entity.label_, "start": offset + entity.start_char,
+                                 "end": offset + entity.end_char})
+            return
+        for token in doc:
+            if token.pos_ == self.core.desired_POS:
+                results[token.text] = results.get(token.text, 0) + 1
+
+    def result(self, results):
+        # Returns a document's result from the matches collected from its chunks, if it had any chunks.
+        if self.core.entity_mode:
+            return results or []
+        counts = sortedcontainers.SortedDict(results or {})
+        if self.counts:
+            return [[token, count] for [token, count] in counts.items()]
+        return list(counts)
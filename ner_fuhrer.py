@@ -21,17 +21,80 @@ def displayHelp():
     print("text to have the program parse through automatically.")
     print("")
     print("-f <filename> : has the program parse through text of a given file.")
+    print("                A directory or wildcard pattern, in quotations,")
+    print("                reads every file it contains or matches.")
     print("-web <website> <filename> : webscrapes text from the specified")
     print("                website and saves the text to the given file before")
     print("                parsing through it.")
+    print("-urls <filename> [directory] : concurrently webscrapes every website")
+    print("                listed in the given file, one per line, parsing")
+    print("                each as it arrives. Website text is saved into the")
+    print("                given directory, if any.")
     print("-p <pos>      : flags a certain part-of-speech to be listed by the ")
     print("                program. This is by default set to proper nouns, i.e.")
     print("                named entities")
     print("-l <lang>     : sets the model's language. This is by default ")
-    print("                English.")
+    print("                English. \"auto\" detects the language of each")
+    print("                chunk and reads it with that language's model.")
     print("-w <filename> : specifies a file to write/echo console output to.")
     print("-a            : flag to select the more accurate, but less efficient")
     print("                NLP model. These spaCy models use the _trf suffix.")
+    print("-b <size>     : streams file chunks through the NLP model in batches")
+    print("                of the given size, which is faster on large files.")
+    print("-j <workers>  : splits the input files into shards and reads them")
+    print("                across the given number of worker processes.")
+    print("-threads <n>  : limits the threads the NLP model of each process")
+    print("                uses for a single operation.")
+    print("-pin [cores]  : pins the process, or each \"-j\" worker, to its own")
+    print("                CPU cores (ex. 0-3,6), or to all available cores.")
+    print("-tb <size>    : batch size used instead of \"-b\" for _trf models.")
+    print("-m            : memory-maps read files rather than reading them")
+    print("                into memory, which is faster on very large files.")
+    print("-s <size>     : sets the chunk size, in characters (ex. 4092), or as a")
+    print("                target number of sentences (ex. 40s) or tokens")
+    print("                (ex. 800t) per chunk.")
+    print("-calibrate    : times a sample of the input at several chunk sizes")
+    print("                and reads with the fastest.")
+    print("-cache <filename> [MB] : caches the tokens found in each chunk in the")
+    print("                given file, so unchanged text skips the NLP model on")
+    print("                later runs. Optionally limits the cache's size.")
+    print("-e            : extracts named entity spans, with their labels and")
+    print("                offsets, instead of tokens, and streams them out as")
+    print("                JSON Lines while reading.")
+    print("-spill <MB>   : bounds the memory used to collect tokens, spilling")
+    print("                them to disk past the given number of megabytes.")
+    print("-count        : counts how often each token occurs, listing tokens")
+    print("                with their counts.")
+    print("-top <K>      : lists only the K most frequent tokens, with their")
+    print("                counts, counted in bounded memory.")
+    print("-prefilter [gazetteer] : skips chunks that cannot hold a desired")
+    print("                token before they reach the model, and chunks")
+    print("                naming none of the gazetteer file's entities.")
+    print("-dedup [sentences] [near] : reads each repeated paragraph, or")
+    print("                sentence, only once, replaying its tokens for")
+    print("                every copy; \"near\" also catches near-duplicates.")
+    print("                With \"-j\", each worker only skips passages it")
+    print("                read itself.")
+    print("-checkpoint <filename> : reads only text appended to the \"-f\"")
+    print("                file(s) since the last run with the same")
+    print("                checkpoint file, then records where reading")
+    print("                stopped.")
+    print("-follow [seconds] : keeps reading text appended to the \"-f\"")
+    print("                file(s), and new files in a directory or pattern,")
+    print("                like \"tail -f\", until interrupted.")
+    print("-stats        : times each stage of the run and counts the bytes,")
+    print("                chunks, tokens and matches read, reporting them")
+    print("                once the run finishes.")
+    print("-profile <filename> : profiles the run with cProfile and saves the")
+    print("                profile into the given file.")
+    print("-index <filename> : saves an index of the tokens of every part-of-")
+    print("                speech, with counts and offsets, into the given file.")
+    print("-columns <filename> : saves every match, with its part-of-speech,")
+    print("                document and offset, into the given file in a")
+    print("                compact binary format.")
+    print("-query <filename> : lists the \"-p\" part-of-speech's tokens from a")
+    print("                saved index or column file, without reading any")
+    print("                text.")
     print("-----------------------------------------------------------------")
 
 
@@ -0,0 +1,64 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Part-of-speech index built by NER_Core in a single pass over the text. Every token is filed under the part-of-speech
+# it was tagged with, along with how often it occurred and where, so the tokens of any part-of-speech can later be
+# listed from the saved index without running the NLP model again.
+import json  # Used to save and load indexes
+
+
+class NER_POS_Index:
+    # Maps each part-of-speech tag to its unique tokens. Each token entry is a [count, offsets] pair, where offsets is a
+    # flat list of alternating document ids and character offsets, one pair per occurrence. Document ids index into
+    # the list of indexed document names.
+
+    def __init__(self):
+        self.model_name = ""
+        self.documents = []
+        self.pos = {}
+
+    def add_document(self, name):
+        # Registers a document to be indexed and returns its id.
+        self.documents.append(name)
+        return len(self.documents) - 1
+
+    def add(self, pos, token, document_id, offset):
+        # Records one occurrence of a token tagged with the given part-of-speech.
+        tokens = self.pos.setdefault(pos, {})
+        entry = tokens.get(token)
+        if entry is None:
+            tokens[token] = [1, [document_id, offset]]
+        else:
+            entry[0] += 1
+            entry[1] += [document_id, offset]
+
+    def tokens(self, pos):
+        # Returns the unique tokens tagged with the given part-of-speech, in alphabetical order.
+        return sorted(self.pos.get(pos, {}))
+
+    def count(self, pos, token):
+        # Returns how many times the given token was tagged with the given part-of-speech.
+        return self.pos.get(pos, {}).get(token, [0, []])[0]
+
+    def occurrences(self, pos, token):
+        # Returns a [document name, character offset] pair for each occurrence of the given token tagged with the
+        # given part-of-speech.
+        offsets = self.pos.get(pos, {}).get(token, [0, []])[1]
+        return [[self.documents[offsets[index]], offsets[index + 1]] for index in range(0, len(offsets), 2)]
+
+    def save(self, file_name):
+        # Saves the index as compact JSON.
+        with open(file_name, "w", encoding='utf-8') as index_file:
+            json.dump({"model": self.model_name, "documents": self.documents, "pos": self.pos}, index_file,
+                      ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def load(file_name):
+        # Loads an index saved by save().
+        with open(file_name, "r", encoding='utf-8') as index_file:
+            saved = json.load(index_file)
+        index = NER_POS_Index()
+        index.model_name = saved["model"]
+        index.documents = saved["documents"]
+        index.pos = saved["pos"]
+        return index
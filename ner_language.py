@@ -0,0 +1,54 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Lightweight, offline language detection used by NER_Core's "-l auto" mode to route each chunk of text to the spaCy
+# pipeline of its language. Every language Grier-NER has a pipeline for is scored by how many of the text's words are
+# among its most common function words, with a bonus for letters only its alphabet uses. This needs no model or
+# download, and is reliable for the paragraph-sized chunks the article reader crops text into.
+import re  # Used to split text into words
+
+detection_sample_size = 4096  # Characters at the start of a text that its language is detected from
+
+# Common function words of each language, keyed by the "-l" code of its pipeline in lang_dict. Words shared between
+# languages, like "il", "des" or "was", are left out, as they cannot tell the languages apart.
+language_words = {
+    "en": {"the", "and", "of", "to", "is", "that", "it", "for", "with", "as", "his", "he", "be", "at", "by", "this",
+           "had", "not", "are", "but", "from", "have", "they", "which", "you", "were", "her", "she", "what", "would",
+           "there", "their", "been", "has", "will", "or", "we", "all", "when", "who", "my"},
+    "de": {"der", "die", "und", "das", "ist", "nicht", "ein", "eine", "zu", "den", "von", "mit", "sich", "auf", "für",
+           "im", "dem", "auch", "es", "als", "wie", "wir", "ich", "sie", "wird", "aus", "bei", "nach", "oder", "aber",
+           "noch", "sind", "hat", "war", "kein", "keine", "dass", "zum", "zur", "über", "nur", "werden"},
+    "fr": {"les", "et", "une", "est", "que", "qui", "dans", "pour", "pas", "sur", "au", "avec", "elle", "ce", "plus",
+           "par", "sont", "nous", "vous", "mais", "été", "ont", "aux", "cette", "je", "leur", "ou", "était", "comme",
+           "tout", "sa", "ses", "lui", "où", "être", "fait", "très"},
+    "it": {"lo", "gli", "di", "che", "è", "una", "per", "non", "con", "del", "della", "sono", "nel", "alla", "anche",
+           "più", "ma", "questo", "ha", "dei", "delle", "al", "nella", "essere", "suo", "sua", "io", "mi", "ci", "era",
+           "molto", "questa", "hanno", "degli", "dello", "nei", "perché", "cosa", "tutto"}
+}
+
+# Letters used by only one of the languages, each worth one extra word
+language_letters = {
+    "de": "äöüß",
+    "fr": "çêëîïôûœ",
+    "it": "ìò"
+}
+
+word_pattern = re.compile(r"[^\W\d_]+")
+
+
+def detect_language(text, default="en"):
+    # Returns the "-l" code of the language the given text is most likely written in, or the default if no language
+    # scores above the others.
+    sample = text[:detection_sample_size].lower()
+    scores = dict.fromkeys(language_words, 0)
+    for word in word_pattern.findall(sample):
+        for [language, words] in language_words.items():
+            if word in words:
+                scores[language] += 1
+    for [language, letters] in language_letters.items():
+        scores[language] += sum(sample.count(letter) for letter in letters)
+    best = max(scores.values())
+    leaders = [language for [language, score] in scores.items() if score == best]
+    if best == 0 or len(leaders) > 1:
+        return default
+    return leaders[0]
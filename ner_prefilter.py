@@ -0,0 +1,83 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Rule-based pre-filter run on each chunk before NER_Core passes it to the NLP model. Chunks that cannot hold a desired
+# token are skipped, and lines that cannot are cut out of the chunks that are kept, so boilerplate like numeric tables
+# never reaches the model. Every check is a single regular expression or string scan, far cheaper than the model.
+import re  # Used to find candidate tokens and letterless lines
+
+# Lines holding at least one digit but no letters, ex. the rows of a numeric table, including their newline
+numeric_line_pattern = re.compile(r"^(?=[^\n]*\d)(?:[\d_]|[^\w\n])*(?:\n|$)", re.MULTILINE)
+
+
+class NER_Prefilter:
+    # Checks applied depend on the desired part-of-speech. Proper nouns are capitalized, so for PROPN a chunk without
+    # an uppercase letter is skipped, and numeric lines are cut out of kept chunks. If a gazetteer of known entities is
+    # given, chunks that mention none of them are skipped too, whatever the part-of-speech. Counts how many chunks and
+    # characters were skipped.
+
+    def __init__(self, desired_POS, gazetteer=()):
+        self.capitals = desired_POS == "PROPN"
+        self.gazetteer_pattern = None
+        entries = sorted(set(entry.strip() for entry in gazetteer if entry.strip() != ""), key=len, reverse=True)
+        if len(entries) > 0:
+            self.gazetteer_pattern = re.compile(r"\b(?:" + "|".join(re.escape(entry) for entry in entries) + r")\b")
+        self.chunks_seen = 0
+        self.chunks_skipped = 0
+        self.characters_seen = 0
+        self.characters_skipped = 0
+
+    def active(self):
+        # Returns whether any check applies.
+        return self.capitals or self.gazetteer_pattern is not None
+
+    def filter(self, chunk):
+        # Returns the given chunk with lines that cannot hold a desired token cut out, or None if the whole chunk can be
+        # skipped.
+        self.chunks_seen += 1
+        self.characters_seen += len(chunk)
+        kept = chunk
+        if self.capitals:
+            if kept == kept.lower():
+                kept = None
+            else:
+                kept = numeric_line_pattern.sub("", kept)
+        if kept is not None and self.gazetteer_pattern is not None and self.gazetteer_pattern.search(kept) is None:
+            kept = None
+        if kept is None:
+            self.chunks_skipped += 1
+            self.characters_skipped += len(chunk)
+        else:
+            self.characters_skipped += len(chunk) - len(kept)
+        return kept
+
+    def chunks(self, chunks):
+        # Generator over the given chunks that pass the filter, shortened.
+        for chunk in chunks:
+            kept = self.filter(chunk)
+            if kept is not None:
+                yield kept
+
+    def take_counts(self):
+        # Returns the [chunks seen, chunks skipped, characters seen, characters skipped] counts since they were last
+        # taken, and resets them. Used to return a worker process's counts to the main process.
+        counts = [self.chunks_seen, self.chunks_skipped, self.characters_seen, self.characters_skipped]
+        self.chunks_seen = self.chunks_skipped = self.characters_seen = self.characters_skipped = 0
+        return counts
+
+    def add_counts(self, counts):
+        # Adds counts returned by take_counts(), ex. from a worker process.
+        self.chunks_seen += counts[0]
+        self.chunks_skipped += counts[1]
+        self.characters_seen += counts[2]
+        self.characters_skipped += counts[3]
+
+    def skip_rate(self):
+        # Returns the fraction of chunks skipped.
+        return self.chunks_skipped / self.chunks_seen if self.chunks_seen > 0 else 0.0
+
+    def report(self):
+        # Prints how many chunks and characters were kept from the model.
+        print("Run info: Pre-filter skipped %d of %d chunks (%.1f%%) and %d of %d characters (%.1f%%)" %
+              (self.chunks_skipped, self.chunks_seen, 100 * self.skip_rate(), self.characters_skipped,
+               self.characters_seen, 100 * self.characters_skipped / max(self.characters_seen, 1)))
@@ -0,0 +1,258 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Long-running server mode for Grier-NER. Keeps one NER_Core pipeline loaded per language and answers requests sent
+# over local HTTP or a Unix socket, so callers skip the Python, spaCy and model start-up cost of ner_fuhrer.py. Requests
+# that arrive at the same time for the same pipeline are read together in a single nlp.pipe() call.
+#
+# Requests are POSTed as JSON with one of "text", "file" or "url", and optionally "pos", "lang" and "accurate", which
+# accept the same values as the "-p", "-l" and "-a" flags; "accurate" is a JSON boolean. Responses are JSON:
+# {"pos": ..., "tokens": [...]}.
+import os  # Used to remove stale Unix socket files
+import sys  # Used to retrieve arguments
+import json  # Used to decode requests and encode responses
+import queue  # Used to hand requests to pipeline workers
+import threading  # Used to run pipeline workers alongside the request handlers
+import time  # Used to time the batching window
+import concurrent.futures  # Used to return worker results to request handlers
+import socketserver  # Used for the Unix socket server
+import http.server  # Used to handle HTTP requests
+import sortedcontainers  # Used to organize returned tokens
+from ner_core import NER_Core, lang_dict, pos_dict
+from article_handler import NER_Article_Reader
+
+batch_window = 0.01  # Seconds a worker waits for more requests to join a batch
+max_batch_texts = 256  # Most texts a worker reads in one nlp.pipe() call
+
+
+class NER_Pipeline_Worker:
+    # Owns one loaded pipeline and a thread that reads queued requests against it in batches.
+
+    def __init__(self, model_name, batch_size):
+        self.core = NER_Core()
+        self.core.lang = model_name
+        self.core.suffix = ""
+        self.core.batch_size = batch_size
+        self.requests = queue.Queue()
+        self.ready = self.core.initialize_nlp()
+        if self.ready:
+            self.thread = threading.Thread(target=self.serve, daemon=True)
+            self.thread.start()
+
+    def submit(self, texts, desired_POS):
+        # Queues the given texts to be read and returns a future holding the tokens of the desired part-of-speech.
+        future = concurrent.futures.Future()
+        self.requests.put((texts, desired_POS, future))
+        return future
+
+    def next_batch(self):
+        # Blocks until a request is queued, then collects any other requests that arrive within the batching window.
+        batch = [self.requests.get()]
+        text_count = len(batch[0][0])
+        deadline = time.monotonic() + batch_window
+        while text_count < max_batch_texts:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            text_count += len(request[0])
+        return batch
+
+    def serve(self):
+        # Worker loop. Every text of a batch is read in one nlp.pipe() call, then each request's docs are filtered by
+        # its own desired part-of-speech.
+        while True:
+            batch = self.next_batch()
+            texts = [text for request in batch for text in request[0]]
+            try:
+                docs = list(self.core.pipe_texts(texts))
+            except Exception as error:
+                for request in batch:
+                    request[2].set_exception(error)
+                continue
+            position = 0
+            for request_texts, desired_POS, future in batch:
+                request_docs = docs[position:position + len(request_texts)]
+                position += len(request_texts)
+                try:
+                    tokens = sortedcontainers.SortedSet()
+                    for doc in request_docs:
+                        tokens.update(token.text for token in doc if token.pos_ == desired_POS)
+                    future.set_result(list(tokens))
+                except Exception as error:
+                    # Only this request failed; the worker keeps serving the others
+                    future.set_exception(error)
+
+
+class NER_Server:
+    # Routes requests to a pipeline worker per spaCy pipeline, loading pipelines that were not preloaded on first use.
+
+    def __init__(self, languages=("en",), accurate=False, batch_size=64, size_limit=8184):
+        self.batch_size = batch_size
+        self.size_limit = size_limit
+        self.workers = {}
+        self.workers_lock = threading.Lock()  # Guards the worker and load lock dictionaries
+        self.load_locks = {}  # Pipeline name -> lock held while it loads
+        for lang in languages:
+            self.worker(lang_dict[lang.lower()] + ("_trf" if accurate else "_sm"))
+
+    def worker(self, model_name):
+        # Returns the worker for the given pipeline, or None if the pipeline could not be loaded. Each pipeline loads
+        # under its own lock, so a cold load only holds up requests for that pipeline.
+        with self.workers_lock:
+            if model_name in self.workers:
+                return self.workers[model_name]
+            load_lock = self.load_locks.setdefault(model_name, threading.Lock())
+        with load_lock:
+            with self.workers_lock:
+                if model_name in self.workers:
+                    # Loaded by another request while this one waited
+                    return self.workers[model_name]
+            worker = NER_Pipeline_Worker(model_name, self.batch_size)
+            if not worker.ready:
+                return None
+            with self.workers_lock:
+                self.workers[model_name] = worker
+            return worker
+
+    def chunks(self, text):
+        # Splits request text into chunks with the article reader, so long texts are read like files.
+        reader = NER_Article_Reader(size_limit=self.size_limit)
+        reader.open_text(text)
+        return list(reader.chunks())
+
+    def handle(self, request):
+        # Reads a decoded JSON request and returns a [status code, response dictionary] pair.
+        pos = str(request.get("pos", "propn")).lower()
+        lang = str(request.get("lang", "en")).lower()
+        if pos not in pos_dict:
+            return [400, {"error": "Given part-of-speech was not recognized."}]
+        if lang not in lang_dict:
+            return [400, {"error": "Given language was not recognized."}]
+        accurate = request.get("accurate", False)
+        if not isinstance(accurate, bool):
+            return [400, {"error": "\"accurate\" must be a JSON boolean, true or false."}]
+        sources = [key for key in ("text", "file", "url") if key in request]
+        if len(sources) != 1:
+            return [400, {"error": "Request needs exactly one of \"text\", \"file\" or \"url\"."}]
+        try:
+            if "text" in request:
+                texts = self.chunks(request["text"])
+            elif "file" in request:
+                reader = NER_Article_Reader(size_limit=self.size_limit)
+                reader.open_file(request["file"])
+                try:
+                    texts = list(reader.chunks())
+                finally:
+                    reader.close()
+            else:
+                texts = self.chunks(NER_Article_Reader().fetchText(request["url"]))
+        except Exception as error:
+            return [400, {"error": "Could not read " + sources[0] + ": " + str(error)}]
+        model_name = lang_dict[lang] + ("_trf" if accurate else "_sm")
+        worker = self.worker(model_name)
+        if worker is None:
+            return [500, {"error": "Failed to load \"" + model_name + "\" spaCy pipeline."}]
+        try:
+            tokens = worker.submit(texts, pos_dict[pos]).result()
+        except Exception as error:
+            return [500, {"error": "Failed to read text: " + str(error)}]
+        return [200, {"pos": pos_dict[pos], "tokens": tokens}]
+
+
+class NER_Request_Handler(http.server.BaseHTTPRequestHandler):
+    # Decodes POSTed JSON requests and passes them to the server's NER_Server.
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as error:
+            [status, response] = [400, {"error": "Invalid JSON request: " + str(error)}]
+        else:
+            [status, response] = self.server.ner.handle(request)
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address to log.
+        return self.client_address[0] if self.client_address else "unix-socket"
+
+
+class NER_Unix_HTTP_Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Threaded HTTP server listening on a Unix socket.
+    daemon_threads = True
+
+
+def serve(ner, port=8080, socket_path=""):
+    # Serves the given NER_Server until interrupted, over a Unix socket if a path is given, or local HTTP otherwise.
+    if socket_path != "":
+        # A socket file left behind by a server that did not exit cleanly would block binding
+        remove_socket(socket_path)
+        server = NER_Unix_HTTP_Server(socket_path, NER_Request_Handler)
+        print("Serving Grier-NER on unix socket " + socket_path)
+    else:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", port), NER_Request_Handler)
+        print("Serving Grier-NER on http://127.0.0.1:" + str(server.server_address[1]))
+    server.ner = ner
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    if socket_path != "":
+        remove_socket(socket_path)
+
+
+def remove_socket(socket_path):
+    # Removes the given Unix socket file, if it exists.
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+
+
+def parseServerArguments(arguments):
+    # Parses server console input. Returns a dictionary of settings, or None if the arguments could not be interpreted.
+    settings = {"languages": [], "accurate": False, "batch_size": 64, "port": 8080, "socket_path": ""}
+    while len(arguments) > 0:
+        flag = arguments[0]
+        if flag == "-a":
+            settings["accurate"] = True
+            arguments = arguments[1:]
+            continue
+        if len(arguments) < 2 or arguments[1][0] == '-':
+            print("Parse error: \"" + flag + "\" needs one argument; none were given.")
+            return None
+        value = arguments[1]
+        if flag == "-l" and value.lower() in lang_dict:
+            settings["languages"].append(value)
+        elif flag in ("-port", "-b") and value.isdigit() and int(value) > 0:
+            settings["port" if flag == "-port" else "batch_size"] = int(value)
+        elif flag == "-socket":
+            settings["socket_path"] = value
+        else:
+            print("Parse error: unrecognized flag or argument \"" + flag + " " + value + "\".")
+            return None
+        arguments = arguments[2:]
+    if len(settings["languages"]) == 0:
+        settings["languages"] = ["en"]
+    return settings
+
+
+if __name__ == '__main__':
+    # Main function call
+    settings = parseServerArguments(sys.argv[1:])
+    if settings is not None:
+        ner = NER_Server(settings["languages"], settings["accurate"], settings["batch_size"])
+        serve(ner, settings["port"], settings["socket_path"])
@@ -0,0 +1,147 @@
+# Author: Michael Fuhrer
+# Created: 2021-04-01   Last Updated: 2021-04-01
+#
+# Run statistics for NER_Core. Times each stage of a run (loading the pipeline, scraping, reading chunks, each pipeline
+# component, output) and counts what passed through it (bytes and chunks read, tokens, matches). Stage times are
+# exclusive: time spent in a stage nested inside another, like the reader feeding chunks to nlp.pipe(), is only counted
+# towards the inner stage. NER_Core only creates statistics when asked to, and otherwise skips every call into them.
+import sys  # Used to report statistics to standard error
+import time  # Used to time stages
+import collections  # Used to pair pipe contexts with their docs
+import contextlib  # Used to time stages in with blocks
+
+
+class NER_Stats:
+    # Stage timers and counters of a run. Callbacks added with add_callback() are called as callback(kind, name, value)
+    # whenever a stage's timer stops ("time", stage, seconds) or a counter is added to ("count", counter, amount), and
+    # once when the run finishes ("done", "run", summary dictionary).
+
+    def __init__(self):
+        self.timers = {}  # Stage -> exclusive seconds
+        self.calls = {}  # Stage -> number of times timed
+        self.counters = {}
+        self.callbacks = []
+        self.stack = []  # [stage, start time, seconds spent in nested stages] of each running timer
+        self.run_start = time.perf_counter()
+        self.run_seconds = 0.0
+
+    def add_callback(self, callback):
+        # Registers a callback to be told of every timed stage and counter change.
+        self.callbacks.append(callback)
+
+    def notify(self, kind, name, value):
+        for callback in self.callbacks:
+            callback(kind, name, value)
+
+    def start(self, stage):
+        # Starts timing a stage, pausing the stage currently being timed.
+        self.stack.append([stage, time.perf_counter(), 0.0])
+
+    def stop(self):
+        # Stops timing the most recently started stage, adding its time, less that of any nested stage, to its timer.
+        [stage, start, nested] = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.timers[stage] = self.timers.get(stage, 0.0) + elapsed - nested
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        if len(self.stack) > 0:
+            self.stack[-1][2] += elapsed
+        self.notify("time", stage, elapsed - nested)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        # Times the body of a with block as the given stage.
+        self.start(stage)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def count(self, name, amount=1):
+        # Adds to the given counter.
+        self.counters[name] = self.counters.get(name, 0) + amount
+        self.notify("count", name, amount)
+
+    def timed_iter(self, stage, items):
+        # Generator over the given items, timing the production of each item as the given stage.
+        iterator = iter(items)
+        while True:
+            self.start(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.stop()
+            yield item
+
+    def read_chunks(self, chunks, offsets=False):
+        # Generator over chunks from a reader, or [chunk, offset] pairs if offsets is set, timing reading and counting
+        # the chunks and bytes read.
+        for item in self.timed_iter("read", chunks):
+            chunk = item[0] if offsets else item
+            self.count("chunks")
+            self.count("bytes read", len(chunk.encode('utf-8')))
+            yield item
+
+    def count_doc(self, doc):
+        # Counts the tokens of a processed doc.
+        self.count("docs")
+        self.count("tokens", len(doc))
+
+    def process(self, nlp, text, disabled_components):
+        # Equivalent of nlp(text, disable=disabled_components), timing the tokenizer and each component separately.
+        with self.timer("nlp.tokenizer"):
+            doc = nlp.make_doc(text)
+        for [name, component] in nlp.pipeline:
+            if name not in disabled_components:
+                with self.timer("nlp." + name):
+                    doc = component(doc)
+        self.count_doc(doc)
+        return doc
+
+    def pipe(self, nlp, texts, batch_size, disabled_components, as_tuples=False):
+        # Equivalent of nlp.pipe(), chaining the tokenizer and each component's own pipe() so each is timed separately.
+        # With as_tuples, texts are (text, context) pairs and (doc, context) pairs are returned.
+        if as_tuples:
+            contexts = collections.deque()
+
+            def split(pairs):
+                for [text, context] in pairs:
+                    contexts.append(context)
+                    yield text
+            for doc in self.pipe(nlp, split(texts), batch_size, disabled_components):
+                yield (doc, contexts.popleft())
+            return
+        docs = self.timed_iter("nlp.tokenizer", (nlp.make_doc(text) for text in texts))
+        for [name, component] in nlp.pipeline:
+            if name in disabled_components:
+                continue
+            if hasattr(component, "pipe"):
+                docs = component.pipe(docs, batch_size=batch_size)
+            else:
+                docs = (component(doc) for doc in docs)
+            docs = self.timed_iter("nlp." + name, docs)
+        for doc in docs:
+            self.count_doc(doc)
+            yield doc
+
+    def finish(self):
+        # Records the run's total time and tells callbacks the run finished.
+        self.run_seconds = time.perf_counter() - self.run_start
+        self.notify("done", "run", self.summary())
+
+    def summary(self):
+        # Returns the statistics as a dictionary.
+        return {"seconds": self.run_seconds, "stages": dict(self.timers), "calls": dict(self.calls),
+                "counters": dict(self.counters)}
+
+    def report(self, output=sys.stderr):
+        # Prints each stage's time and share of the run, slowest first, followed by each counter and its rate.
+        print("---------- Run Statistics ----------", file=output)
+        total = max(self.run_seconds, 1e-9)
+        for [stage, seconds] in sorted(self.timers.items(), key=lambda timer: -timer[1]):
+            print("%-20s %9.3f s %6.1f%% %8d calls" % (stage, seconds, 100 * seconds / total, self.calls[stage]),
+                  file=output)
+        print("%-20s %9.3f s" % ("total", self.run_seconds), file=output)
+        for [name, amount] in sorted(self.counters.items()):
+            print("%-20s %12d %14.1f/s" % (name, amount, amount / total), file=output)
@@ -6,16 +6,40 @@
 """
 import unittest  # Main testing framework
 import time  # Used to test computation time for some tests
+import os  # Used to name temporary files
+import json  # Used to encode server requests
+import tempfile  # Used for temporary cache files
+import sortedcontainers  # Used to compare against the bounded-memory token set
+import threading  # Used to run the test server and send concurrent requests
+import http.server  # Used to run the test server
+import urllib.request  # Used to send server requests
+import collections  # Used to count words exactly for the top-K test
+import subprocess  # Used to check which modules start-up imports
+import sys  # Used to start Python for the start-up test
+import pathlib  # Used to pass file paths to the extractor
+import ner_server
+import ner_benchmark
+import ner_core
 from ner_core import NER_Core
-from article_handler import NER_Article_Reader
+from article_handler import NER_Article_Reader, NER_Mapped_Reader, NER_Web_Fetcher, NER_HTML_Text, NER_Web_Text
+from ner_index import NER_POS_Index
+from ner_columns import NER_Column_Writer, NER_Column_Reader
+from ner_aggregate import NER_Spill_Set, NER_Top_K
+from ner_stats import NER_Stats
+from ner_language import detect_language
+from ner_prefilter import NER_Prefilter
+from ner_dedup import NER_Dedup
+from ner_extractor import NER_Extractor
 
 
-def NER_article_read(file_name, byte_count=4092, display=False, lang="en_core_web_sm"):
-    # Runs the given file through an NER core. Text chunk size, language, and whether output should be displayed are
-    # customizable depending on test case.
+def NER_article_read(file_name, byte_count=4092, display=False, lang="en_core_web_sm", batch_size=0, pos="PROPN"):
+    # Runs the given file through an NER core. Text chunk size, language, nlp.pipe() batch size, desired part-of-speech,
+    # and whether output should be displayed are customizable depending on test case.
     core = NER_Core()
     core.lang = lang
     core.suffix = ""
+    core.batch_size = batch_size
+    core.desired_POS = pos
     core.initialize_nlp()
     core.reader = NER_Article_Reader(file_name, byte_count)
     core.read_from_file()
@@ -70,6 +94,63 @@ class NER_Tester(unittest.TestCase):
         print("Approximate accuracy: %.2f" % accuracy)
         assert accuracy >= 0.8
 
+    def test_prefilter_recall(self):
+        # Tests the PROPN pre-filter on the Emancipation Proclamation followed by boilerplate: rows of a numeric table
+        # and lowercase navigation links. Recall against the expected proper nouns should match reading without the
+        # pre-filter, while most chunks, all boilerplate, are skipped.
+        expected_tokens = set(open("tests/emancipation-proclamation-propn.txt").read().splitlines())
+        table = "".join(" ".join(str(row * column) for column in range(12)) + "\n" for row in range(40))
+        navigation = "home | about | contact | login | terms of use | privacy\n" * 8
+        [handle, file_name] = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(handle, "w", encoding='utf-8') as boilerplate_file:
+            boilerplate_file.write(open("tests/emancipation-proclamation.txt", encoding='utf-8').read() + "\n\n")
+            boilerplate_file.write((table + navigation) * 40)
+        recalls = []
+        for prefilter in [False, True]:
+            core = NER_Core()
+            core.lang = "en_core_web_sm"
+            core.suffix = ""
+            core.initialize_nlp()
+            if prefilter:
+                core.prefilter = NER_Prefilter(core.desired_POS)
+            core.reader = NER_Article_Reader(file_name, 1024)
+            core.read_from_file()
+            core.reader.close()
+            recalls.append(len(expected_tokens & set(core.desired_tokens)) / len(expected_tokens))
+        os.remove(file_name)
+        print("Recall without pre-filter: %.3f, with: %.3f" % (recalls[0], recalls[1]))
+        print("Chunks skipped: %d of %d" % (core.prefilter.chunks_skipped, core.prefilter.chunks_seen))
+        assert recalls[1] >= recalls[0] - 0.02
+        assert core.prefilter.skip_rate() > 0.5
+
+    def test_dedup(self):
+        # Tests deduplication on three copies of the Emancipation Proclamation, each followed by the same license
+        # paragraph. Counted tokens should match reading every copy, while most of the text is replayed rather than
+        # read. A passage differing by one word should only be replayed when near-duplicates are caught.
+        text = open("tests/emancipation-proclamation.txt", encoding='utf-8').read()
+        license_text = ("This eBook is for the use of anyone anywhere in the United States and most other parts of "
+                        "the world at no cost and with almost no restrictions whatsoever.")
+        counts = []
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            for copy in range(3):
+                with open(os.path.join(corpus_dir, "%d.txt" % copy), "w", encoding='utf-8') as copy_file:
+                    copy_file.write(text + "\n\n" + license_text + "\n")
+            for dedup in [[], ["-dedup"]]:
+                core = NER_Core()
+                assert core.parseArguments(["-count", "-b", "8", "-s", "1024"] + dedup + ["-f", corpus_dir])
+                core.run()
+                counts.append(dict(core.desired_tokens.items()))
+        assert counts[0] == counts[1]
+        assert core.dedup.replay_rate() > 0.6
+        changed = license_text.replace("almost", "nearly")
+        for [near, replayed] in [[False, 0], [True, 1]]:
+            dedup = NER_Dedup(near=near)
+            first = list(dedup.chunks([license_text], "model", None))
+            dedup.record(first[0], [["States", first[0].index("States")]])
+            found = []
+            assert list(dedup.chunks([changed], "model", found.extend)) == ([] if near else [changed])
+            assert dedup.passages_replayed == replayed and found == ["States"] * replayed
+
     def test_parse_behavior(self):
         # Test to ensure article reader preserves words and sentences when 'chunking' them. Reading from a custom text
         # file, test-parse-behavior.txt which contained sentences/words of certain length that will require the cropping
@@ -86,34 +167,525 @@ class NER_Tester(unittest.TestCase):
         assert read_chunks == expected_chunks
 
 
-    def test_parse_timing(self):
-        # Test used to compare the computation time of different methods of parsing through a text file. Compares
-        # line-by-line reading, <=1024 byte chunk reading, and <=4092 byte chunk reading.
+    def test_mapped_parse_behavior(self):
+        # Same as test_parse_behavior, but for the memory-mapped article reader, which should crop chunks identically.
+        # Also compares both readers' chunks of a larger ASCII text and the time each takes to chunk Moby Dick.
+        reader = NER_Mapped_Reader("./tests/test-parse-behavior.txt", size_limit=16)
+        expected_chunks = ["one two three.", "four five six?", "seven eight!", "nine ten.", "onetwothreefour",
+                           "fivesixseven", "nineteneleven"]
+        read_chunks = [chunk.strip(" \n") for chunk in reader.chunks()]
+        reader.close()
+        assert read_chunks == expected_chunks
+        file_name = "tests/emancipation-proclamation.txt"
+        for size_limit in [64, 1024, 4092]:
+            assert list(NER_Article_Reader(file_name, size_limit).chunks()) == \
+                   list(NER_Mapped_Reader(file_name, size_limit).chunks())
+        for reader_class in [NER_Article_Reader, NER_Mapped_Reader]:
+            t_start = time.time()
+            reader = reader_class("tests/moby-dick.txt", 8184)
+            chunk_count = len(list(reader.chunks()))
+            reader.close()
+            print("%s: %d chunks in %.3f seconds" % (reader_class.__name__, chunk_count, time.time() - t_start))
+
+    def test_appended_read(self):
+        # Tests reading a growing file in rounds. The Emancipation Proclamation is appended to a file in uneven pieces,
+        # some ending mid-character or between "\r" and "\n", and after each piece only the appended text is read,
+        # continuing from a checkpoint. Every chunk should be found at its character offset in the text, and only the
+        # text after the last sentence end should be held back.
+        text = "Ünïcødé – test.\r\n" + open("tests/emancipation-proclamation.txt", encoding='utf-8').read()
+        data = text.encode('utf-8')
+        expected_text = text.replace("\r\n", "\n")
+        [handle, file_name] = tempfile.mkstemp(suffix=".txt")
+        os.close(handle)
+        checkpoint = None
+        chunks = []
+        for end in list(range(7, len(data), 613)) + [len(data)]:
+            with open(file_name, "ab") as appended_file:
+                appended_file.write(data[appended_file.tell():end])
+            reader = NER_Article_Reader(size_limit=300)
+            reader.open_appended(file_name, checkpoint)
+            chunks += list(reader.offsetChunks())
+            checkpoint = json.loads(json.dumps(reader.checkpoint()))
+            reader.close()
+        assert checkpoint["offset"] == len(data)
+        for [chunk, offset] in chunks:
+            assert expected_text[offset:offset + len(chunk)] == chunk
+        [last_chunk, last_offset] = chunks[-1]
+        assert last_chunk[-1] == "."
+        assert expected_text[last_offset + len(last_chunk):] == checkpoint["carry_over"]
+        # Without holding back, as once the file is left unchanged, the held back text is read too
+        reader = NER_Article_Reader(size_limit=300)
+        reader.open_appended(file_name, checkpoint, hold_back=False)
+        held_chunks = list(reader.offsetChunks())
+        checkpoint = reader.checkpoint()
+        reader.close()
+        os.remove(file_name)
+        assert "".join(chunk for [chunk, offset] in held_chunks).split() == expected_text[last_offset +
+                                                                                          len(last_chunk):].split()
+        assert checkpoint["carry_over"] == ""
+
+    def test_chunk_target(self):
+        # Tests chunking toward a target number of sentences. Chunks should be joined until they reach the target, and
+        # joining them should not merge or drop any words.
         file_name = "tests/moby-dick.txt"
-        # Line-by-line reading
-        print("------   Line-by-Line Reading...   ------")
-        t0_start = time.time()
+        reader = NER_Article_Reader(file_name, 512)
+        reader.chunk_target = 20
+        chunks = list(reader.chunks())
+        assert all(reader.countUnits(chunk) >= 20 for chunk in chunks[:-1])
+        whole_text = open(file_name, encoding='utf-8').read()
+        assert "".join(chunks).split() == whole_text.split()
+
+    def test_calibration(self):
+        # Tests chunk size calibration on a sample of Moby Dick. Every candidate size should be timed, and the reader
+        # should be left at the fastest one. An index and column file already open, as with "-web", should be left empty.
+        core = NER_Core()
+        core.initialize_nlp()
+        core.index = NER_POS_Index()
+        [handle, column_file] = tempfile.mkstemp(suffix=".bin")
+        os.close(handle)
+        core.columns = NER_Column_Writer(column_file)
+        core.begin_document("sample")
+        sample_text = open("tests/moby-dick.txt", encoding='utf-8').read(16384)
+        timings = core.calibrate_chunk_size(sample_text, sizes=["1024", "4092", "10s"], repeats=1)
+        for [size, seconds] in timings:
+            print("%8s: %.3f seconds" % (size, seconds))
+        assert sorted(size for [size, seconds] in timings) == ["1024", "10s", "4092"]
+        fastest = timings[0][0]
+        if fastest == "10s":
+            assert core.reader.chunk_target == 10
+        else:
+            assert core.reader.chunk_target == 0 and core.reader.chunk_size_limit == int(fastest)
+        assert len(core.desired_tokens) == 0
+        assert core.index.tokens("PROPN") == []
+        core.columns.close()
+        with NER_Column_Reader(column_file) as columns:
+            assert list(columns.rows()) == []
+        os.remove(column_file)
+
+    def test_spill_set(self):
+        # Tests the bounded-memory token set by adding every word of Moby Dick with a memory limit small enough to
+        # force many spills to disk. Iterating should give the same alphabetical unique list as a SortedSet.
+        words = open("tests/moby-dick.txt", encoding='utf-8').read().split()
+        spill_set = NER_Spill_Set(64 * 1024)
+        spill_set.update(words)
+        assert len(spill_set.run_files) > 1
+        assert list(spill_set) == sortedcontainers.SortedSet(words)._list
+        spill_set.clear()
+        assert len(spill_set) == 0
+
+    def test_top_k(self):
+        # Tests the streaming top-K counter by counting every word of Moby Dick. The ten most frequent words and their
+        # counts should match an exact count, and the counter should never hold more than its capacity.
+        words = open("tests/moby-dick.txt", encoding='utf-8').read().split()
+        top_k = NER_Top_K(10)
+        top_k.update(words)
+        assert len(top_k.counts) <= top_k.capacity
+        exact = sorted(collections.Counter(words).items(), key=lambda pair: (-pair[1], pair[0]))[:10]
+        assert top_k.items() == [[word, count] for [word, count] in exact]
+        # Without spilling, the token set is an exact counter
+        counter = NER_Spill_Set()
+        counter.update(words)
+        assert dict(counter.items()) == collections.Counter(words)
+
+    def test_benchmark(self):
+        # Runs the benchmark harness on the Emancipation Proclamation at one chunk size with two repeats, and checks
+        # that every stage was measured and summarized. Results compared against themselves should show no regressions,
+        # while a baseline twice as fast should flag every rate.
+        results = ner_benchmark.run_benchmarks(["tests/emancipation-proclamation.txt"], ["4092"], ["en_core_web_sm"],
+                                               repeats=2, display=False, thread_counts=[])
+        names = [entry["name"] for entry in results["results"]]
+        assert names == ["startup/help", "startup/parse-error", "chunking/emancipation-proclamation.txt/4092",
+                         "load/en_core_web_sm",
+                         "nlp/en_core_web_sm/emancipation-proclamation.txt/4092/unbatched",
+                         "nlp/en_core_web_sm/emancipation-proclamation.txt/4092/batched"]
+        for entry in results["results"]:
+            assert entry["seconds"]["runs"] == 2
+            assert entry["seconds"]["min"] <= entry["seconds"]["median"] <= entry["seconds"]["max"]
+        [unbatched, batched] = results["results"][4:]
+        assert unbatched["tokens"] == batched["tokens"] > 0
+        assert ner_benchmark.compare_to_baseline(results, json.loads(json.dumps(results))) == []
+        faster = json.loads(json.dumps(results))
+        for entry in faster["results"]:
+            for metric in ner_benchmark.rate_metrics:
+                if metric in entry:
+                    entry[metric]["median"] *= 2
+        assert len(ner_benchmark.compare_to_baseline(results, faster)) == 6
+
+    def test_thread_controls(self):
+        # Tests the CPU controls. Core lists should be parsed, transformer pipelines should use the transformer batch
+        # size, and the thread benchmark should read the same tokens in every process it runs side by side, pinned to
+        # their own cores, and report the host's throughput as the sum of theirs.
+        assert ner_core.parse_cores("0-2,5") == [0, 1, 2, 5] and ner_core.parse_cores("3-1") is None
         core = NER_Core()
-        with open(file_name, "rb") as read_file:
-            for line in read_file:
-                core.read(line.decode('utf-8'))
-        read_file.close()
-        t0_end = time.time()
-        t0_total = t0_end - t0_start
-        print("Elapsed Time: %.3f" % t0_total)
-
-        def timed_read(byte_count):
-            print("------   %dB Chunk Reading...   ------" % byte_count)
+        assert core.parseArguments(["-a", "-b", "64", "-tb", "4", "-pin", "Some text."])
+        core.pin_cores = []
+        core.apply_cpu_settings()
+        assert core.batch_size == 4
+        file_name = "tests/emancipation-proclamation.txt"
+        # Each process loads its own pipeline, so only a couple are run; the benchmark itself sweeps every core
+        entry = ner_benchmark.benchmark_threads("en_core_web_sm", 1, file_name, "4092", 64, 2, max_processes=2)
+        assert entry["processes"] == min(2, len(ner_core.available_cores())) and entry["tokens"] > 0
+        assert entry["seconds"]["runs"] == 2 * entry["processes"]
+        host_rate = entry["host_tokens_per_second"]["median"]
+        assert entry["tokens_per_second"]["min"] <= host_rate
+        best = ner_benchmark.best_thread_settings({"results": [entry]})
+        assert best["en_core_web_sm"] is entry
+
+    def test_lazy_imports(self):
+        # Tests that starting ner_fuhrer.py and parsing arguments, including arguments it rejects, imports neither spaCy
+        # nor the webscraping libraries.
+        check = ("import sys, ner_fuhrer; ner_fuhrer.NER_Core().parseArguments(['-p', 'not-a-pos']); "
+                 "print('Imported: ' + ','.join(name for name in ['spacy', 'requests', 'asyncio'] "
+                 "if name in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True)
+        assert result.returncode == 0
+        assert result.stdout.splitlines()[-1] == "Imported: "
+
+    def test_language_detection(self):
+        # Tests the offline language detector used by "-l auto" on the German and English test texts, and on French and
+        # Italian sentences. Text with no words falls back to English.
+        for [file_name, language] in [["tests/test-german-essay.txt", "de"], ["tests/test-german-simple.txt", "de"],
+                                      ["tests/emancipation-proclamation.txt", "en"], ["tests/test-simple.txt", "en"]]:
+            assert detect_language(open(file_name, encoding='utf-8').read()) == language
+        assert detect_language("Le chat est sur la table et il dort avec son ami dans la maison.") == "fr"
+        assert detect_language("Il gatto è sul tavolo e dorme con il suo amico nella casa.") == "it"
+        assert detect_language("1865-1866") == "en"
+
+    def test_batch_timing(self):
+        # Compares the computation time of reading Moby Dick chunk by chunk, with one NLP model call per chunk, against
+        # streaming the same chunks through nlp.pipe() in batches. Both methods should find the same tokens.
+        file_name = "tests/moby-dick.txt"
+
+        def timed_read(batch_size):
+            print("------   Batch Size %d Reading...   ------" % batch_size)
             t_start = time.time()
-            NER_article_read(file_name, byte_count)
-            t_end = time.time()
-            t_total = t_end - t_start
+            tokens = NER_article_read(file_name, batch_size=batch_size)
+            t_total = time.time() - t_start
             print("Elapsed Time: %.3f" % t_total)
+            return tokens
+
+        loop_tokens = timed_read(0)
+        batched_tokens = timed_read(64)
+        assert loop_tokens._list == batched_tokens._list
+
+    def test_run_stats(self):
+        # Tests that reading the Emancipation Proclamation with run statistics on finds the same tokens as reading it
+        # without, that every chunk is counted, and that callbacks are told of each stage and the end of the run.
+        file_name = "tests/emancipation-proclamation.txt"
+        plain_tokens = NER_article_read(file_name, batch_size=16)
+        core = NER_Core()
+        core.lang = "en_core_web_sm"
+        core.suffix = ""
+        core.batch_size = 16
+        core.stats = NER_Stats()
+        events = []
+        core.stats.add_callback(lambda kind, name, value: events.append([kind, name]))
+        core.initialize_nlp()
+        core.reader = NER_Article_Reader(file_name, 1024)
+        core.read_from_file()
+        core.stats.finish()
+        assert core.desired_tokens._list == plain_tokens._list
+        counters = core.stats.counters
+        assert counters["chunks"] == counters["docs"] > 1
+        assert counters["bytes read"] == os.path.getsize(file_name)
+        assert counters["matches"] >= len(plain_tokens)
+        assert "read" in core.stats.timers and "nlp.tagger" in core.stats.timers
+        assert ["time", "nlp.tagger"] in events and events[-1] == ["done", "run"]
+
+    def test_parallel_read(self):
+        # Tests that sharding a directory of files across worker processes finds the same tokens as reading each file
+        # in order within a single process.
+        file_pattern = "tests/emancipation-proclamation*.txt"
+        serial_core = NER_Core()
+        serial_core.read_file = file_pattern
+        serial_core.initialize_nlp()
+        for file_name in serial_core.resolve_read_files():
+            serial_core.reader = NER_Article_Reader(file_name, 4092)
+            serial_core.read_from_file()
+        parallel_core = NER_Core()
+        parallel_core.read_file = file_pattern
+        parallel_core.workers = 2
+        parallel_core.reader = NER_Article_Reader(size_limit=4092)
+        assert parallel_core.read_files_parallel(parallel_core.resolve_read_files())
+        assert serial_core.desired_tokens._list == parallel_core.desired_tokens._list
+
+    def test_disabled_components(self):
+        # Tests that the pipeline components the core disables, ex. the parser and NER, are not needed to tag parts-of-
+        # speech; reading with them disabled should find the same tokens as running the full pipeline.
+        file_name = "tests/emancipation-proclamation.txt"
+        core = NER_Core()
+        core.initialize_nlp()
+        assert "parser" in core.disabled_components and "ner" in core.disabled_components
+        core.reader = NER_Article_Reader(file_name, 4092)
+        core.read_from_file()
+        full_core = NER_Core()
+        full_core.initialize_nlp()
+        full_core.disabled_components = []
+        full_core.reader = NER_Article_Reader(file_name, 4092)
+        full_core.read_from_file()
+        assert core.desired_tokens._list == full_core.desired_tokens._list
+
+    def test_model_cache(self):
+        # Tests that cores loading the same pipeline share one cached copy, and that clearing the cache makes the next
+        # core load the pipeline again.
+        first_core = NER_Core()
+        first_core.initialize_nlp()
+        second_core = NER_Core()
+        second_core.initialize_nlp()
+        assert first_core.nlp is second_core.nlp
+        ner_core.clear_model_cache()
+        third_core = NER_Core()
+        third_core.initialize_nlp()
+        assert first_core.nlp is not third_core.nlp
+
+    def test_server(self):
+        # Tests server mode by starting an NER server on a free local port and sending it concurrent requests, which
+        # the server should batch together. Each response should match what a core finds in the same text.
+        ner = ner_server.NER_Server(["en"])
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ner_server.NER_Request_Handler)
+        server.ner = ner
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:%d/" % server.server_address[1]
+        texts = ["Dave bought an Apple phone.", "Mr. Noel lives by the Wall.", "Walls are built by hand."]
+        responses = [None] * len(texts)
+
+        def post(index):
+            request = urllib.request.Request(url, data=json.dumps({"text": texts[index]}).encode("utf-8"))
+            responses[index] = json.loads(urllib.request.urlopen(request).read().decode("utf-8"))
+
+        threads = [threading.Thread(target=post, args=(index,)) for index in range(len(texts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        server.shutdown()
+        server.server_close()
+        for index in range(len(texts)):
+            core = NER_Core()
+            core.initialize_nlp()
+            core.read_text(texts[index])
+            assert responses[index]["tokens"] == core.desired_tokens._list
+        assert ner.handle({"text": texts[0], "accurate": "false"})[0] == 400
+
+    def test_extractor(self):
+        # Tests the library interface by reading text, a file path, an open file and an empty text in one lazy, batched
+        # call. Each document's tokens should match a core reading the same document alone.
+        file_name = "tests/emancipation-proclamation.txt"
+        text = "Dave bought an Apple phone. Mr. Noel lives by the Wall."
+        with NER_Extractor(lang="en", pos="propn", batch_size=4, size="1024") as extractor:
+            with open(file_name, "r", encoding='utf-8') as text_file:
+                results = list(extractor.extract_all([text, pathlib.Path(file_name), text_file, ""]))
+            counts = extractor.extract(text)
+        assert len(results) == 4 and results[3] == []
+        core = NER_Core()
+        core.initialize_nlp()
+        core.read_text(text)
+        assert results[0] == counts == core.desired_tokens._list
+        core = NER_Core()
+        core.initialize_nlp()
+        core.reader.open_file(file_name)
+        core.read_from_file()
+        core.reader.close()
+        assert results[1] == results[2] == core.desired_tokens._list
+        with NER_Extractor(counts=True) as extractor:
+            assert extractor.extract("Dave met Dave.") == [["Dave", 2]]
+        with self.assertRaises(ValueError):
+            NER_Extractor(pos="not-a-pos")
+
+    def test_concurrent_webscrape(self):
+        # Tests concurrent webscraping against a local stand-in web server. Every page should be fetched and have its
+        # text extracted, and a missing page should be reported as an error rather than stopping the other fetches.
+        class PageHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if not self.path.startswith("/page/"):
+                    self.send_error(404)
+                    return
+                body = ("<html><body><p>Page %s mentions Dave.</p></body></html>" % self.path[6:]).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:%d/" % server.server_address[1]
+        urls = [url + "page/%d" % index for index in range(50)] + [url + "missing"]
+        fetcher = NER_Web_Fetcher(concurrency=8, per_host=4)
+        entries = {entry[0]: entry for entry in fetcher.texts(urls)}
+        fetcher.close()
+        server.shutdown()
+        server.server_close()
+        assert sorted(entries) == sorted(urls)
+        for index in range(50):
+            assert entries[url + "page/%d" % index][1].strip() == "Page %d mentions Dave." % index
+        assert entries[url + "missing"][1] is None and entries[url + "missing"][2] is not None
+
+    def test_streaming_html(self):
+        # Tests the streaming HTML-to-text extractor on a page downloaded a few bytes at a time, splitting tags,
+        # character references and multi-byte characters. Non-content elements should be dropped, whitespace collapsed,
+        # and the text should match extracting the whole page at once.
+        page = ("<html><head><title>Menu</title><style>p { color: red; }</style></head><body>\n"
+                "<script>document.write('<p>Hidden</p>');</script>\n\n\n<h1>Chapter   VIII</h1>\n\n\n\n"
+                "<p>I couldn’t sleep all night;\n   a foghorn was groaning on the Sound.</p>\n\n\n\n"
+                "<p>Gatsby &amp; Daisy met at the caf&eacute;.</p></body></html>")
+        expected = "Chapter VIII\n\nI couldn’t sleep all night; a foghorn was groaning on the Sound.\n\n" \
+                   "Gatsby & Daisy met at the café."
+        for use_lxml in [True, False]:
+            parser = NER_HTML_Text(use_lxml)
+            parser.feed(page)
+            parser.close()
+            assert parser.take() == expected
+
+        class Response:
+            headers = {"Content-Type": "text/html; charset=utf-8"}
+
+            def iter_content(self, size):
+                data = page.encode("utf-8")
+                return (data[index:index + 3] for index in range(0, len(data), 3))
+
+            def close(self):
+                pass
+        reader = NER_Article_Reader(size_limit=60)
+        reader.text_file = NER_Web_Text(Response(), 3)
+        reader.carry_over_text = ""
+        reader.read_offset = 0
+        chunks = list(reader.chunks())
+        reader.close()
+        # Chunks cropped at a word end drop the whitespace they were cropped at
+        assert [word for chunk in chunks for word in chunk.split()] == expected.split()
+        assert all(len(chunk) <= 60 for chunk in chunks)
+        Response.headers = {"Content-Type": "text/html"}
+        page = "<html><head><meta charset=\"windows-1252\"></head><body><p>Café – naïve</p></body></html>"
+        data = page.encode("cp1252")
+        Response.iter_content = lambda self, size: (data[index:index + size] for index in range(0, len(data), size))
+        assert NER_Web_Text(Response(), 5).read_all() == "Café – naïve"
+
+    def test_result_cache(self):
+        # Tests the result cache by reading the same file twice with one cache file. The second read should find every
+        # chunk in the cache, skipping the NLP model, and find the same tokens as the first.
+        file_name = "tests/emancipation-proclamation.txt"
+        with tempfile.TemporaryDirectory() as cache_dir:
+            found_tokens = []
+            for _ in range(2):
+                core = NER_Core()
+                core.cache_file = os.path.join(cache_dir, "results.db")
+                core.initialize_nlp()
+                core.open_cache()
+                core.reader = NER_Article_Reader(file_name, 1024)
+                core.read_from_file()
+                found_tokens.append(core.desired_tokens._list)
+                misses = core.cache.misses
+                core.close_cache()
+            assert misses == 0
+            assert found_tokens[0] == found_tokens[1]
+
+    def test_pos_index(self):
+        # Tests the part-of-speech index by indexing the Emancipation Proclamation in one pass, then comparing the
+        # proper nouns and nouns listed from the saved index against reading the text once for each. Every recorded
+        # offset should point at its token within the text.
+        file_name = "tests/emancipation-proclamation.txt"
+        text = open(file_name, encoding='utf-8').read()
+        with tempfile.TemporaryDirectory() as index_dir:
+            index_file = os.path.join(index_dir, "index.json")
+            core = NER_Core()
+            core.initialize_nlp()
+            core.index = NER_POS_Index()
+            core.reader = NER_Article_Reader(file_name, 1024)
+            core.begin_document(file_name)
+            core.read_from_file()
+            core.index.save(index_file)
+            index = NER_POS_Index.load(index_file)
+        for pos in ["PROPN", "NOUN"]:
+            assert index.tokens(pos) == NER_article_read(file_name, 1024, pos=pos)._list
+            for token in index.tokens(pos):
+                for [document, offset] in index.occurrences(pos, token):
+                    assert text[offset:offset + len(token)] == token
+
+    def test_column_output(self):
+        # Tests the binary column output by reading the Emancipation Proclamation with "-columns" and counted tokens,
+        # then memory-mapping the saved file. Its tokens and counts should match the core's, every offset should point
+        # at its token, and "-query" should list the same tokens from it. Rows written across several small batches
+        # should be read back in order.
+        file_name = "tests/emancipation-proclamation.txt"
+        text = open(file_name, encoding='utf-8').read()
+        with tempfile.TemporaryDirectory() as column_dir:
+            column_file = os.path.join(column_dir, "matches.bin")
+            core = NER_Core()
+            assert core.parseArguments(["-count", "-s", "1024", "-columns", column_file, "-f", file_name])
+            core.run()
+            columns = NER_Column_Reader(column_file)
+            assert columns.documents == [file_name] and columns.model_name == "en_core_web_sm"
+            tokens = columns.tokens("PROPN")
+            assert tokens == [token for [token, count] in core.desired_tokens.items()]
+            for [token, count] in core.desired_tokens.items():
+                assert columns.count(token) == count
+                for [document, offset] in columns.occurrences(token):
+                    assert text[offset:offset + len(token)] == token
+            columns.close()
+            query_core = NER_Core()
+            assert query_core.parseArguments(["-query", column_file])
+            assert list(query_core.run()) == tokens
+            batch_file = os.path.join(column_dir, "batches.bin")
+            rows = [["Dave", "PROPN", "a.txt", 0], ["Zoë", "GPE", "b.txt", 2 ** 40], ["Dave", "GPE", "a.txt", 7]] * 3
+            writer = NER_Column_Writer(batch_file, batch_rows=2)
+            documents = {"a.txt": writer.add_document("a.txt"), "b.txt": writer.add_document("b.txt")}
+            for [token, pos, document, offset] in rows:
+                writer.add(token, pos, documents[document], offset)
+            writer.close()
+            with NER_Column_Reader(batch_file) as columns:
+                assert list(columns.rows()) == rows and len(columns.batches) == 5
+                assert columns.pos_counts("GPE") == {"Zoë": 3, "Dave": 3} and columns.count("Dave") == 6
+                assert columns.occurrences("Dave") == [["a.txt", 0], ["a.txt", 7]] * 3
+                batch = columns.batch_columns(columns.batches[0])
+            with self.assertRaises(ValueError):
+                # Released on closing
+                batch[0][0]
+
+    def test_entity_stream(self):
+        # Tests entity mode by streaming the Emancipation Proclamation's entities to a JSON Lines file with small
+        # chunks, so many entities come from chunks after carried over text. Every entity's offsets should point at
+        # its text within the document, and multi-word entities like "United States" should be kept whole.
+        file_name = "tests/emancipation-proclamation.txt"
+        text = open(file_name, encoding='utf-8').read()
+        with tempfile.TemporaryDirectory() as output_dir:
+            core = NER_Core()
+            core.save_file = os.path.join(output_dir, "entities.jsonl")
+            assert core.parseArguments(["-e", "-s", "256", "-f", file_name])
+            core.run()
+            entities = [json.loads(line) for line in open(core.save_file, encoding='utf-8')]
+        assert len(entities) > 0
+        for entity in entities:
+            assert text[entity["start"]:entity["end"]] == entity["text"] and entity["label"] != ""
+        assert "United States" in [entity["text"] for entity in entities]
 
-        # Chunk (1024 Bytes) reading
-        timed_read(1024)
-        # Chunk (4096 Bytes) reading
-        timed_read(4092)
+    def test_entity_checkpoint(self):
+        # Tests entity mode with a checkpoint by streaming the entities of the Emancipation Proclamation, appended to a
+        # file in two halves, over two runs. The second run should append to the first run's entities, with chunks
+        # numbered on from where the first run stopped, and together they should match reading the whole text at once.
+        text = open("tests/emancipation-proclamation.txt", encoding='utf-8').read()
+        with tempfile.TemporaryDirectory() as output_dir:
+            file_name = os.path.join(output_dir, "growing.txt")
+            save_file = os.path.join(output_dir, "entities.jsonl")
+            arguments = ["-e", "-s", "512", "-checkpoint", os.path.join(output_dir, "checkpoint.json"), "-w",
+                         save_file, "-f", file_name]
+            run_lines = []
+            for end in [len(text) // 2, len(text)]:
+                with open(file_name, "a", encoding='utf-8') as growing_file:
+                    growing_file.write(text[growing_file.tell():end])
+                core = NER_Core()
+                assert core.parseArguments(arguments)
+                core.run()
+                run_lines.append(len(open(save_file, encoding='utf-8').readlines()))
+            entities = [json.loads(line) for line in open(save_file, encoding='utf-8')]
+        assert 0 < run_lines[0] < run_lines[1] == len(entities)
+        chunk_numbers = [entity["chunk"] for entity in entities]
+        assert chunk_numbers == sorted(chunk_numbers)
+        for entity in entities:
+            assert text[entity["start"]:entity["end"]] == entity["text"]
 
     def test_webscrape(self):
         # Tests webscraping behavior by pulling text from gutenberg.org and saving it in test folder.